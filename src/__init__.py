@@ -0,0 +1,22 @@
+"""
+src - expense tracker package
+
+Submodules are loaded lazily on first attribute access (PEP 562), so
+`import src` does not pull in pandas/streamlit through src.ui.
+"""
+
+import importlib
+
+__all__ = ["models", "storage", "tracker", "ui"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
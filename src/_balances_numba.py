@@ -0,0 +1,68 @@
+"""
+_balances_numba.py - numeric core of the balance reduction
+
+Accumulates net balances per (unit, person) cell on integer cents, so sums are
+exact. With numba installed (requirements-optional.txt) this is one compiled
+pass over the CSR arrays of src.storage.ExpenseArrays; without it the same
+totals come from np.bincount. numba is imported and the loop compiled on the
+first call, not at import.
+"""
+
+import numpy as np
+
+
+def _accumulate_loop(amount_cents, payer_idx, unit_idx, part_indptr, part_indices, part_cents, n_units, n_people):
+    out = np.zeros((n_units, n_people), dtype=np.int64)
+    for i in range(len(amount_cents)):
+        lo, hi = part_indptr[i], part_indptr[i + 1]
+        if lo == hi:
+            # nobody to split with: the expense is ignored
+            continue
+        u = unit_idx[i]
+        out[u, payer_idx[i]] += amount_cents[i]
+        for j in range(lo, hi):
+            out[u, part_indices[j]] -= part_cents[j]
+    return out
+
+
+def _accumulate_bincount(amount_cents, payer_idx, unit_idx, part_indptr, part_indices, part_cents, n_units, n_people):
+    counts = np.diff(part_indptr)
+    credited = counts > 0
+    size = n_units * n_people
+    payer_cell = unit_idx[credited] * n_people + payer_idx[credited]
+    part_cell = np.repeat(unit_idx, counts) * n_people + part_indices
+    # float64 weights hold integer cents exactly well past any realistic total
+    out = np.bincount(payer_cell, weights=amount_cents[credited], minlength=size)
+    out -= np.bincount(part_cell, weights=part_cents, minlength=size)
+    return np.rint(out).astype(np.int64).reshape(n_units, n_people)
+
+
+_kernel = None
+
+
+def _get_kernel():
+    """The compiled loop when numba is installed, else the bincount version; resolved on first use."""
+    global _kernel
+    if _kernel is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _kernel = _accumulate_bincount
+        else:
+            _kernel = njit(cache=True)(_accumulate_loop)
+    return _kernel
+
+
+def net_cents(arrays) -> np.ndarray:
+    """(n_units, n_people) int64 matrix of net balances in cents for an ExpenseArrays."""
+    n_units, n_people = len(arrays.units), len(arrays.people)
+    return _get_kernel()(
+        np.rint(np.round(arrays.amounts, 2) * 100).astype(np.int64),
+        arrays.payer_idx.astype(np.int64),
+        arrays.unit_idx.astype(np.int64),
+        arrays.part_indptr.astype(np.int64),
+        arrays.part_indices.astype(np.int64),
+        np.rint(arrays.part_shares * 100).astype(np.int64),
+        n_units,
+        n_people,
+    )
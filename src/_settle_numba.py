@@ -0,0 +1,67 @@
+"""
+_settle_numba.py - numeric core of the settle-up matcher
+
+Greedy matching of debtors against creditors on integer cents: the largest
+remaining debt always pays the largest remaining credit, tracked with two
+max-heaps. Compiled with numba (requirements-optional.txt) when it is
+installed. Without numba the same loop runs as plain Python, so results are
+identical either way. numba is imported and the loop compiled on the first
+call, not at import, so app start-up does not pay for it.
+"""
+
+import heapq
+
+import numpy as np
+
+
+def _match(debt_cents, cred_cents):
+    """
+    Match debts against credits (both positive int64 cents).
+
+    Heap entries are (-cents, idx), so ties go to the lower index.
+    Returns an (k, 3) int64 array of (debtor_idx, creditor_idx, cents) rows.
+    """
+    debt_h = [(-debt_cents[i], i) for i in range(len(debt_cents))]
+    cred_h = [(-cred_cents[j], j) for j in range(len(cred_cents))]
+    heapq.heapify(debt_h)
+    heapq.heapify(cred_h)
+    out = np.empty((len(debt_cents) + len(cred_cents), 3), dtype=np.int64)
+    k = 0
+    while debt_h and cred_h:
+        d_neg, i = heapq.heappop(debt_h)
+        c_neg, j = heapq.heappop(cred_h)
+        pay = min(-d_neg, -c_neg)
+        out[k, 0] = i
+        out[k, 1] = j
+        out[k, 2] = pay
+        k += 1
+        # push back whatever is left on either side
+        if -d_neg > pay:
+            heapq.heappush(debt_h, (d_neg + pay, i))
+        if -c_neg > pay:
+            heapq.heappush(cred_h, (c_neg + pay, j))
+    return out[:k]
+
+
+_kernel = None
+
+
+def _get_kernel():
+    """_match, compiled with numba on first use when it is installed."""
+    global _kernel
+    if _kernel is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _kernel = _match
+        else:
+            _kernel = njit(cache=True)(_match)
+    return _kernel
+
+
+def match_settlements(debt_cents: np.ndarray, cred_cents: np.ndarray) -> np.ndarray:
+    """Run the matcher on int64 cent arrays (index order breaks ties)."""
+    return _get_kernel()(
+        np.ascontiguousarray(debt_cents, dtype=np.int64),
+        np.ascontiguousarray(cred_cents, dtype=np.int64),
+    )
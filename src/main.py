@@ -1,27 +1,101 @@
-from streamlit import st
-from src.tracker import ExpenseTracker
-from src.ui.dashboard import display_dashboard
-from src.ui.components import add_expense_form, display_expenses, display_balances, display_settle_suggestions
+import streamlit as st
+import os
+from src.tracker import ExpenseTracker, DATA_FILE
+
+
+@st.cache_resource
+def _get_tracker():
+    return ExpenseTracker()
+
+
+def _data_version(tracker):
+    """Cheap cache key for derived views: data file mtime plus the tracker's change counter."""
+    mtime = os.path.getmtime(DATA_FILE) if os.path.exists(DATA_FILE) else 0.0
+    return mtime, tracker.data_version()
+
+
+@st.cache_data(show_spinner=False)
+def _compute_balances_cached(_tracker, version):
+    return _tracker.balances_by_year()
+
+
+@st.cache_data(show_spinner=False)
+def _compute_settlements_cached(_tracker, version):
+    return _tracker.settle_suggestions()
+
+
+def _invalidate_derived():
+    # adds already change the version key; this just drops stale entries
+    _compute_balances_cached.clear()
+    _compute_settlements_cached.clear()
+
+
+# Handlers import src.ui.components on first use so that pandas/altair are
+# only loaded once a view that renders them is selected.
+def _add_expense_form(tracker):
+    from src.ui import components
+
+    def on_submit(exp_input: components.ExpenseInput):
+        tracker.add_expense(
+            amount=exp_input.amount,
+            payer=exp_input.payer,
+            participants=exp_input.participants,
+            category=exp_input.category,
+            description=exp_input.description,
+            unit=exp_input.unit,
+            shares=exp_input.shares,
+            date=exp_input.date,
+        )
+
+    # a submit that adds both a category and an expense is saved once
+    components.display_expense_form(on_submit, tracker.get_categories(), tracker.add_category, batch=tracker.batch)
+
+
+def _list_expenses(tracker):
+    from src.ui import components
+
+    components.display_expense_list(tracker.list_expenses())
+
+
+def _show_balances(tracker):
+    from src.ui import components
+
+    components.display_balances(_compute_balances_cached(tracker, _data_version(tracker)))
+
+
+def _show_settle_suggestions(tracker):
+    from src.ui import components
+
+    components.display_settle_suggestions(_compute_settlements_cached(tracker, _data_version(tracker)))
+
+
+def _clear_all(tracker):
+    if st.button("Clear All Expenses"):
+        tracker.clear()
+        _invalidate_derived()
+        st.success("All expenses cleared.")
+
+
+# label -> handler jump table; _MENU keeps the display order
+_HANDLERS = {
+    "Add Expense": _add_expense_form,
+    "List Expenses": _list_expenses,
+    "Show Balances": _show_balances,
+    "Show Settle Suggestions": _show_settle_suggestions,
+    "Clear All Expenses": _clear_all,
+}
+_MENU = tuple(_HANDLERS)
+
 
 def main():
     st.title("Expense Tracker")
-    tracker = ExpenseTracker()
-
-    menu = ["Add Expense", "List Expenses", "Show Balances", "Show Settle Suggestions", "Clear All Expenses"]
-    choice = st.sidebar.selectbox("Select an option", menu)
-
-    if choice == "Add Expense":
-        add_expense_form(tracker)
-    elif choice == "List Expenses":
-        display_expenses(tracker)
-    elif choice == "Show Balances":
-        display_balances(tracker)
-    elif choice == "Show Settle Suggestions":
-        display_settle_suggestions(tracker)
-    elif choice == "Clear All Expenses":
-        if st.button("Clear All Expenses"):
-            tracker.clear()
-            st.success("All expenses cleared.")
+    # one shared tracker per process; re-read only when the data file changed on disk
+    tracker = _get_tracker()
+    if tracker.local_data_changed():
+        tracker.reload()
+
+    choice = st.sidebar.radio("Select an option", _MENU, key="menu")
+    _HANDLERS[choice](tracker)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,14 +3,17 @@ models.py - Data model definitions
 
 This file defines the Expense dataclass used across the tracker and UI.
 Expenses are serialized to/from simple dicts so they can be persisted as JSON
-in data/expenses_data.json.
+in data/expenses_data.json. The class uses __slots__ (no per-instance __dict__)
+since the tracker keeps every expense in memory.
 """
 
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import Dict, Tuple
+import datetime
+import sys
 
 
-@dataclass
+@dataclass(slots=True)
 class Expense:
     """
     Represents a single household expense.
@@ -19,37 +22,62 @@ class Expense:
       - id: integer unique id assigned by the tracker (for display/reference)
       - amount: numeric total amount of the expense (float, currency implied by `unit`)
       - payer: who paid (restricted in UI to "Alessio" or "Morgan")
-      - participants: list of names who share the expense (subset of household)
+      - participants: tuple of names who share the expense (subset of household);
+        lists passed in are converted so the value can be hashed and cached safely
       - category: expense category (e.g. Groceries); tracker persists category list
       - description: optional free-text description
-      - unit: currency/unit string (e.g. "EUR", "USD"); tracker groups balances by unit
+      - unit: currency/unit string (e.g. "EUR", "USD"); tracker groups balances by unit.
+        Always a non-empty, stripped string: blank/missing values become "EUR"
       - shares: optional mapping participant -> amount (useful for custom splits)
       - date: ISO date string "YYYY-MM-DD" (mandatory in UI)
+
+    _year/_month hold the parsed date (0 when missing or invalid) so filters don't
+    re-parse the string; call refresh_period() after assigning a new date.
     """
     id: int = field(default=0)
     amount: float = 0.0
     payer: str = ""
-    participants: List[str] = field(default_factory=list)
+    participants: Tuple[str, ...] = ()
     category: str = "general"
     description: str = ""
     unit: str = "EUR"
     shares: Dict[str, float] = field(default_factory=dict)
     date: str = ""  # stored as ISO "YYYY-MM-DD"
+    _year: int = field(default=0, init=False, repr=False, compare=False)
+    _month: int = field(default=0, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not isinstance(self.participants, tuple):
+            self.participants = tuple(self.participants or ())
+        self.unit = (self.unit or "").strip() or "EUR"
+        if self.shares is None:
+            self.shares = {}
+        self.refresh_period()
+
+    def refresh_period(self):
+        """Re-derive _year/_month from the date string."""
+        try:
+            d = datetime.date.fromisoformat(self.date)
+        except Exception:
+            self._year = self._month = 0
+        else:
+            self._year, self._month = d.year, d.month
 
     def to_dict(self) -> Dict:
         """
         Convert to a plain dict suitable for JSON serialization.
-        The tracker writes lists of these dicts to the data file.
+        The tracker writes lists of these dicts to the data file. Containers are
+        copied so the result never aliases the live expense.
         """
         return {
             "id": self.id,
             "amount": self.amount,
             "payer": self.payer,
-            "participants": self.participants,
+            "participants": list(self.participants),
             "category": self.category,
             "description": self.description,
             "unit": self.unit,
-            "shares": self.shares,
+            "shares": dict(self.shares),
             "date": self.date,
         }
 
@@ -58,15 +86,16 @@ class Expense:
         """
         Construct an Expense from a dict (inverse of to_dict).
         Uses defaults for missing keys so older/corrupted files are tolerated.
+        Names, categories and units repeat across expenses, so they are interned.
         """
         return Expense(
             id=d.get("id", 0),
             amount=d.get("amount", 0.0),
-            payer=d.get("payer", ""),
-            participants=d.get("participants", []) or [],
-            category=d.get("category", "general"),
+            payer=sys.intern(d.get("payer", "") or ""),
+            participants=tuple(sys.intern(str(p)) for p in (d.get("participants", []) or [])),
+            category=sys.intern(d.get("category", "general") or ""),
             description=d.get("description", ""),
-            unit=d.get("unit", "EUR"),
+            unit=sys.intern(d.get("unit", "EUR") or ""),
             shares=d.get("shares", {}) or {},
             date=d.get("date", "") or "",
         )
\ No newline at end of file
@@ -1,52 +1,380 @@
-from dataclasses import dataclass, field
-from typing import List
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Dict, List
 import json
 import os
+import threading
+
+import numpy as np
+
+from src.models import Expense
+from src._balances_numba import net_cents
+
+# orjson is optional: it serializes straight to bytes and parses much faster,
+# but the stdlib encoder produces the same documents.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ijson is optional: large snapshots are parsed one expense at a time instead
+# of materializing the whole document first.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# zstandard is optional: when present the snapshot is kept zstd-compressed
+# (level 3) next to the legacy plain-JSON file.
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
 
 DATA_FILE = os.path.join(os.path.dirname(__file__), "../data/expenses_data.json")
+COMPRESSED_FILE = DATA_FILE + ".zst"
+ZSTD_LEVEL = 3
+# append-only log of expenses added since the last full rewrite of DATA_FILE
+LOG_FILE = os.path.splitext(DATA_FILE)[0] + ".jsonl"
+NEXT_ID_FILE = os.path.join(os.path.dirname(DATA_FILE), "expenses_next_id.txt")
+# collapse the log back into DATA_FILE once it grows past this size
+LOG_COMPACT_BYTES = 1 << 20
+# snapshots larger than this are stream-parsed when ijson is available
+STREAM_PARSE_BYTES = 8 << 20
 
 @dataclass
-class Expense:
-    amount: float
-    payer: str
-    participants: List[str]
-    category: str = "general"
-    description: str = ""
-    id: int = field(default=0)
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "amount": self.amount,
-            "payer": self.payer,
-            "participants": self.participants,
-            "category": self.category,
-            "description": self.description,
-        }
+class ExpenseArrays:
+    """
+    Column-oriented (structure-of-arrays) view of an expense list.
 
-    @staticmethod
-    def from_dict(d):
-        return Expense(
-            amount=d["amount"],
-            payer=d["payer"],
-            participants=d["participants"],
-            category=d.get("category", "general"),
-            description=d.get("description", ""),
-            id=d.get("id", 0),
+    Names are interned into the people/units/categories tables and referenced
+    by index. Participants use a CSR layout: the debit entries of expense i are
+    part_indices[part_indptr[i]:part_indptr[i + 1]] with matching part_shares.
+    """
+    amounts: np.ndarray        # float64[N]
+    payer_idx: np.ndarray      # int32[N] -> people
+    unit_idx: np.ndarray       # int32[N] -> units
+    category_idx: np.ndarray   # int32[N] -> categories
+    part_indptr: np.ndarray    # int32[N + 1]
+    part_indices: np.ndarray   # int32[nnz] -> people
+    part_shares: np.ndarray    # float64[nnz] amount owed by each participant
+    years: np.ndarray          # int32[N] parsed date year, 0 when missing/invalid
+    months: np.ndarray         # int32[N] parsed date month, 0 when missing/invalid
+    people: List[str]
+    units: List[str]
+    categories: List[str]
+
+
+def expenses_to_arrays(expenses) -> ExpenseArrays:
+    """
+    Build an ExpenseArrays from Expense objects.
+    Custom shares are used as-is; otherwise each participant owes
+    round(amount / len(participants), 2), matching the tracker's balance rules.
+    """
+    people: Dict[str, int] = {}
+    units: Dict[str, int] = {}
+    categories: Dict[str, int] = {}
+    n = len(expenses)
+    amounts = np.empty(n, dtype=np.float64)
+    payer_idx = np.empty(n, dtype=np.int32)
+    unit_idx = np.empty(n, dtype=np.int32)
+    category_idx = np.empty(n, dtype=np.int32)
+    years = np.empty(n, dtype=np.int32)
+    months = np.empty(n, dtype=np.int32)
+    part_indptr = np.zeros(n + 1, dtype=np.int32)
+    part_indices: List[int] = []
+    part_shares: List[float] = []
+    for i, e in enumerate(expenses):
+        amounts[i] = e.amount
+        payer_idx[i] = people.setdefault(e.payer, len(people))
+        unit_idx[i] = units.setdefault(e.unit, len(units))
+        category_idx[i] = categories.setdefault(e.category, len(categories))
+        years[i], months[i] = e._year, e._month
+        if e.shares:
+            for p, s in e.shares.items():
+                part_indices.append(people.setdefault(p, len(people)))
+                part_shares.append(round(s, 2))
+        elif e.participants:
+            share = round(e.amount / len(e.participants), 2)
+            for p in e.participants:
+                part_indices.append(people.setdefault(p, len(people)))
+                part_shares.append(share)
+        part_indptr[i + 1] = len(part_indices)
+    return ExpenseArrays(
+        amounts=amounts,
+        payer_idx=payer_idx,
+        unit_idx=unit_idx,
+        category_idx=category_idx,
+        part_indptr=part_indptr,
+        part_indices=np.asarray(part_indices, dtype=np.int32),
+        part_shares=np.asarray(part_shares, dtype=np.float64),
+        years=years,
+        months=months,
+        people=list(people),
+        units=list(units),
+        categories=list(categories),
+    )
+
+
+def compute_balances(arrays: ExpenseArrays) -> Dict[str, Dict[str, float]]:
+    """
+    Net balance per unit and person ({unit: {person: balance}}): payers are
+    credited the rounded amount, participants debited their share. Expenses
+    without any participants are ignored. Sums are taken on integer cents by
+    src._balances_numba (numba-compiled when available).
+    """
+    n_units, n_people = len(arrays.units), len(arrays.people)
+    size = n_units * n_people
+    counts = np.diff(arrays.part_indptr)
+    credited = counts > 0
+    payer_cell = arrays.unit_idx * n_people + arrays.payer_idx
+    part_cell = np.repeat(arrays.unit_idx, counts) * n_people + arrays.part_indices
+    net = net_cents(arrays).ravel() / 100
+    # only report people that took part in an expense of that unit, in the
+    # order they first appear there (each expense's participants, then its payer)
+    n_parts = len(arrays.part_indices)
+    part_pos = np.arange(n_parts) + np.repeat(np.arange(len(counts)), counts)
+    payer_pos = arrays.part_indptr[1:] + np.arange(len(counts))
+    first = np.full(size, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, part_cell, part_pos)
+    np.minimum.at(first, payer_cell[credited], payer_pos[credited])
+
+    net, first = net.reshape(n_units, n_people), first.reshape(n_units, n_people)
+    result: Dict[str, Dict[str, float]] = {}
+    for u, unit in enumerate(arrays.units):
+        cols = np.flatnonzero(first[u] != np.iinfo(np.int64).max)
+        cols = cols[np.argsort(first[u, cols], kind="stable")]
+        result[unit] = {arrays.people[p]: float(net[u, p]) for p in cols}
+    return result
+
+
+def compute_balances_by_year(arrays: ExpenseArrays) -> Dict[int, Dict[str, Dict[str, float]]]:
+    """
+    compute_balances() for each year's expenses ({year: {unit: {person: balance}}}),
+    in one reduction: every (year, unit) pair becomes its own unit. Expenses
+    without a valid date are left out; years come out ascending.
+    """
+    if not len(arrays.amounts):
+        return {}
+    n_units = len(arrays.units)
+    key = arrays.years.astype(np.int64) * n_units + arrays.unit_idx
+    # (year, unit) groups numbered in order of first appearance, as the units of
+    # a per-year ExpenseArrays would be
+    uniq, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(uniq), dtype=np.int64)
+    rank[order] = np.arange(len(uniq))
+    groups = [(k // n_units, arrays.units[k % n_units]) for k in uniq[order].tolist()]
+    by_group = compute_balances(replace(arrays, unit_idx=rank[inverse.ravel()], units=groups))
+    result: Dict[int, Dict[str, Dict[str, float]]] = {}
+    for year, unit in sorted(by_group, key=lambda g: g[0]):
+        if year:
+            result.setdefault(year, {})[unit] = by_group[(year, unit)]
+    return result
+
+
+# JSON helpers shared with src.tracker: orjson when installed, else stdlib json
+# writing the same compact, UTF-8 (unescaped) documents
+def _dumps(obj, indent: bool = False) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+
+def _snapshot_path() -> str:
+    if zstd is not None:
+        return COMPRESSED_FILE
+    # a plain file newer than the compressed one is current (ExpenseTracker writes it);
+    # an older one is stale and must not be fallen back to silently
+    if os.path.exists(COMPRESSED_FILE) and _mtime(COMPRESSED_FILE) >= _mtime(DATA_FILE):
+        raise RuntimeError(
+            f"{COMPRESSED_FILE} holds the current expenses but zstandard is not installed; "
+            "install it (pip install zstandard) to read it"
         )
+    return DATA_FILE
+
+
+@contextmanager
+def _open_snapshot(path: str):
+    """Binary reader over a snapshot, transparently decompressing .zst files."""
+    with open(path, "rb") as f:
+        if path.endswith(".zst"):
+            with zstd.ZstdDecompressor().stream_reader(f) as reader:
+                yield reader
+        else:
+            yield f
+
+
+# Parsed expenses keyed on the snapshot/log file mtimes: reruns that find the
+# files unchanged reuse the previous parse instead of re-reading the JSON.
+@lru_cache(maxsize=1)
+def _load_expenses_cached(path: str, data_mtime: float, log_mtime: float) -> List[Expense]:
+    expenses: List[Expense] = []
+    if data_mtime:
+        with _open_snapshot(path) as f:
+            if ijson is not None and os.path.getsize(path) > STREAM_PARSE_BYTES:
+                expenses = [Expense.from_dict(d) for d in ijson.items(f, "expenses.item", use_float=True)]
+            else:
+                data = _loads(f.read())
+                expenses = [Expense.from_dict(d) for d in data.get("expenses", [])]
+    if log_mtime:
+        with open(LOG_FILE, "rb") as f:
+            for line in f:
+                if line.strip():
+                    expenses.append(Expense.from_dict(_loads(line)))
+    return expenses
 
 
 class Storage:
-    @staticmethod
-    def load_expenses() -> List[Expense]:
-        if not os.path.exists(DATA_FILE):
+    # per-thread write buffer used while a batch() block is open
+    _batch = threading.local()
+    # long-lived unbuffered handle on LOG_FILE, shared by all appends until compaction
+    _append_fh = None
+    _append_lock = threading.Lock()
+
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        """
+        Group writes: saves/appends inside the block are buffered and written
+        once on exit (only the last full save is kept, plus appends made after it).
+        """
+        if getattr(cls._batch, "active", False):
+            yield
+            return
+        cls._batch.active = True
+        cls._batch.pending_save = None
+        cls._batch.pending_appends = []
+        try:
+            yield
+        finally:
+            cls._batch.active = False
+            pending_save, pending_appends = cls._batch.pending_save, cls._batch.pending_appends
+            cls._batch.pending_save, cls._batch.pending_appends = None, []
+            if pending_save is not None:
+                cls.save_expenses(*pending_save)
+            if pending_appends:
+                cls._write_appends(pending_appends, pending_appends[-1][1])
+
+    @classmethod
+    def _migrate_legacy(cls):
+        """
+        Copy the plain-JSON snapshot into the compressed file whenever the plain one
+        is newer: ExpenseTracker keeps writing it, so this is not a one-shot.
+        The plain file is kept.
+        """
+        if zstd is None or not os.path.exists(DATA_FILE) or _mtime(COMPRESSED_FILE) >= _mtime(DATA_FILE):
+            return
+        with open(DATA_FILE, "rb") as f:
+            data = _loads(f.read())
+        expenses = [Expense.from_dict(d) for d in data.get("expenses", [])]
+        next_id = int(data.get("next_id", 1))
+        if os.path.exists(LOG_FILE):
+            # fold pending log entries in too, since the save below drops the log
+            expenses.extend(_load_expenses_cached(DATA_FILE, 0.0, _mtime(LOG_FILE)))
+            next_id = max(next_id, cls.load_next_id())
+        cls.save_expenses(expenses, next_id)
+
+    @classmethod
+    def load_expenses(cls) -> List[Expense]:
+        cls._migrate_legacy()
+        path = _snapshot_path()
+        data_mtime, log_mtime = _mtime(path), _mtime(LOG_FILE)
+        if not data_mtime and not log_mtime:
             return []
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return [Expense.from_dict(d) for d in data.get("expenses", [])]
+        # fresh Expense objects, so callers can mutate them without corrupting the cache
+        return [replace(e, shares=dict(e.shares)) for e in _load_expenses_cached(path, data_mtime, log_mtime)]
+
+    @staticmethod
+    def load_as_arrays() -> ExpenseArrays:
+        """Stored expenses as parallel numpy columns (see ExpenseArrays)."""
+        return expenses_to_arrays(Storage.load_expenses())
 
     @staticmethod
-    def save_expenses(expenses: List[Expense], next_id: int):
+    def load_next_id() -> int:
+        """Next id to hand out: the log sidecar wins over the snapshot value."""
+        if os.path.exists(NEXT_ID_FILE):
+            with open(NEXT_ID_FILE, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 1)
+        path = _snapshot_path()
+        if not os.path.exists(path):
+            return 1
+        with _open_snapshot(path) as f:
+            return int(_loads(f.read()).get("next_id", 1))
+
+    @classmethod
+    def append_expense(cls, e: Expense, next_id: int, durable: bool = False):
+        """
+        Record a single new expense without rewriting DATA_FILE.
+        Edits and deletes still go through save_expenses, which also compacts the log.
+        """
+        if getattr(cls._batch, "active", False):
+            cls._batch.pending_appends.append((e, next_id))
+            return
+        cls._write_appends([(e, next_id)], next_id, durable=durable)
+
+    @classmethod
+    def _write_appends(cls, items, next_id: int, durable: bool = False):
+        payload = b"".join(_dumps(e.to_dict()) + b"\n" for e, _ in items)
+        with cls._append_lock:
+            fh = cls._append_fh
+            if fh is None or fh.name != LOG_FILE:
+                cls._close_append_fh()
+                fh = cls._append_fh = open(LOG_FILE, "ab", buffering=0)
+            fh.write(payload)
+            if durable:
+                os.fsync(fh.fileno())
+            log_size = fh.tell()
+        with open(NEXT_ID_FILE, "w", encoding="utf-8") as f:
+            f.write(str(next_id))
+        _load_expenses_cached.cache_clear()
+        if log_size > LOG_COMPACT_BYTES:
+            cls.save_expenses(cls.load_expenses(), next_id)
+
+    @classmethod
+    def save_expenses(cls, expenses: List[Expense], next_id: int):
+        if getattr(cls._batch, "active", False):
+            # a full save supersedes anything appended earlier in the batch
+            cls._batch.pending_save = (list(expenses), next_id)
+            cls._batch.pending_appends = []
+            return
         data = {"next_id": next_id, "expenses": [e.to_dict() for e in expenses]}
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
\ No newline at end of file
+        path = _snapshot_path()
+        if zstd is not None:
+            payload = zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(_dumps(data))
+        else:
+            payload = _dumps(data, indent=True)
+        # compaction is the only full write, so make it atomic and durable:
+        # write a temp file, fsync it, then rename over the snapshot
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # the snapshot now holds everything the log did; rotate the append handle
+        with cls._append_lock:
+            cls._close_append_fh()
+            for path in (LOG_FILE, NEXT_ID_FILE):
+                if os.path.exists(path):
+                    os.remove(path)
+        _load_expenses_cached.cache_clear()
+
+    @classmethod
+    def _close_append_fh(cls):
+        if cls._append_fh is not None:
+            cls._append_fh.close()
+            cls._append_fh = None
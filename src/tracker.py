@@ -10,19 +10,30 @@ Responsibilities:
      totals_by_month/year, category management
 """
 
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Set, Tuple, Any
 import sys
 from src.models import Expense
+from src.storage import ExpenseArrays, compute_balances, compute_balances_by_year, expenses_to_arrays, _dumps, _loads
+from src._settle_numba import match_settlements
 import json
 import os
-import datetime
-from collections import defaultdict
+import contextlib
+import copy
+import functools
+import io
 import ast
+import atexit
+import bisect
+import collections
 import tempfile
-import shutil
 import logging
+import mmap
+import threading
 import time
 import urllib.request
+import weakref
+
+import numpy as np
 
 # Optional Google Sheets backend imports are lazy/optional; we try to use them
 try:
@@ -32,6 +43,12 @@ except Exception:
     gspread = None
     Credentials = None
 
+# orjson is optional; stdlib json is used when it's missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # location of the JSON persistence file (relative to src/)
 _default_data_file = os.path.join(os.path.dirname(__file__), "..", "data", "expenses_data.json")
 # When running under pytest, use a temp file to avoid reading/writing the project's
@@ -40,6 +57,14 @@ if any("pytest" in p for p in sys.argv) or os.getenv("PYTEST_CURRENT_TEST"):
     DATA_FILE = os.path.join(tempfile.gettempdir(), "tmp_expenses_test.json")
 else:
     DATA_FILE = _default_data_file
+# append-only log of add/edit/delete ops applied on top of DATA_FILE; folded back
+# into DATA_FILE (and removed) by every full save
+JOURNAL_FILE = os.path.splitext(DATA_FILE)[0] + "_journal.jsonl"
+# resolved once; save() writes its temp file next to the target
+_DATA_FILE_ABS = os.path.abspath(DATA_FILE)
+_DATA_DIR = os.path.dirname(_DATA_FILE_ABS)
+# compact once the journal holds this many ops or outgrows twice the snapshot
+JOURNAL_COMPACT_OPS = 500
 
 # default categories shown when the data file has no categories saved yet
 DEFAULT_CATEGORIES = [
@@ -76,6 +101,108 @@ if not logger.handlers:
 
 FX_API_URL = os.getenv("FX_API_URL", "https://api.frankfurter.app/latest?from=EUR&to=CHF,USD")
 FX_CACHE_TTL_SECONDS = int(os.getenv("FX_CACHE_TTL_SECONDS", "3600"))
+# after a failed FX lookup, reruns reuse the fallback this long instead of waiting on the provider again
+FX_RETRY_SECONDS = int(os.getenv("FX_RETRY_SECONDS", "60"))
+# how long a Google Sheets load stays fresh enough to write on top of without re-reading
+SHEETS_REFRESH_SECONDS = float(os.getenv("SHEETS_REFRESH_SECONDS", "30"))
+# full-state Google Sheets saves wait this long for further edits and go out as one write (0 = immediate)
+SHEETS_SAVE_DELAY_SECONDS = float(os.getenv("SHEETS_SAVE_DELAY_SECONDS", "2"))
+# fsync the local JSON file on every save (TRACKER_FSYNC=1); off by default, see ExpenseTracker.save
+TRACKER_FSYNC = os.getenv("TRACKER_FSYNC", "0") == "1"
+# write the local JSON snapshot indented for manual debugging (TRACKER_PRETTY=1); compact otherwise
+TRACKER_PRETTY = os.getenv("TRACKER_PRETTY", "0") == "1"
+# data files at least this big are parsed from a memory map
+MMAP_LOAD_BYTES = 1 << 20
+# per data version, how many filter selections (position sets) keep a memoized CHF total
+POSITIONS_MEMO_SIZE = 32
+
+
+def _json_dump_file(obj, f, indent: bool = False) -> None:
+    """
+    Serialize obj into the binary file f. orjson hands back one bytes blob that goes
+    out in a single write; stdlib json streams through a text wrapper instead of
+    building the whole document as a str and then again as bytes.
+    """
+    if orjson is not None:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0))
+        return
+    w = io.TextIOWrapper(f, encoding="utf-8", write_through=False)
+    try:
+        if indent:
+            json.dump(obj, w, indent=2, ensure_ascii=False)
+        else:
+            json.dump(obj, w, separators=(",", ":"), ensure_ascii=False)
+        w.flush()
+    finally:
+        # leave f open for the caller
+        w.detach()
+
+
+def _json_load_file(path: str):
+    """Parse a JSON file; big files go to orjson straight from an mmap instead of a bytes copy."""
+    with open(path, "rb") as f:
+        if orjson is not None and os.fstat(f.fileno()).st_size >= MMAP_LOAD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+                return orjson.loads(view)
+        return _loads(f.read())
+
+
+# trackers holding a delayed Google Sheets save; flushed before any Sheets load and at exit
+_SHEETS_DIRTY: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _flush_sheets_saves():
+    for tracker in list(_SHEETS_DIRTY):
+        tracker.flush()
+
+
+atexit.register(_flush_sheets_saves)
+
+
+def _locked(method):
+    """Run an ExpenseTracker method under the tracker's lock (one instance serves every session)."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _versioned_cache(method=None, *, maxsize: Optional[int] = None):
+    """
+    Memoize an ExpenseTracker method on its arguments until the tracker's _version
+    changes (mutators bump it). Callers get a deep copy so they can't alter the cache.
+    Runs under the tracker's lock, so a result is never computed from a half-applied mutation.
+    maxsize bounds the method's entries within a version, evicting the least recently
+    used, for methods keyed on open-ended arguments; None keeps every entry.
+    """
+    if method is None:
+        return functools.partial(_versioned_cache, maxsize=maxsize)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            if self._cache_version != self._version:
+                self._cache.clear()
+                self._cache_version = self._version
+            if maxsize is None:
+                entries = self._cache
+                key = (method.__name__, args, tuple(sorted(kwargs.items())))
+            else:
+                entries = self._cache.setdefault(method.__name__, collections.OrderedDict())
+                key = (args, tuple(sorted(kwargs.items())))
+            if key in entries:
+                if maxsize is not None:
+                    entries.move_to_end(key)
+            else:
+                entries[key] = method(self, *args, **kwargs)
+                if maxsize is not None and len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return copy.deepcopy(entries[key])
+
+    return wrapper
 
 
 class FXRateService:
@@ -90,6 +217,9 @@ class FXRateService:
 
     _cache: Optional[Dict[str, Any]] = None
     _cached_at: float = 0.0
+    # set by a failed lookup: when it happened and the exception class name
+    _failed_at: float = 0.0
+    _failure: str = ""
 
     @classmethod
     def get_snapshot(cls, force_refresh: bool = False) -> Dict[str, Any]:
@@ -100,6 +230,8 @@ class FXRateService:
             and (now - cls._cached_at) < FX_CACHE_TTL_SECONDS
         ):
             return dict(cls._cache)
+        if not force_refresh and cls._failure and (now - cls._failed_at) < FX_RETRY_SECONDS:
+            return cls._fallback(cls._failure)
 
         try:
             req = urllib.request.Request(
@@ -129,20 +261,28 @@ class FXRateService:
             }
             cls._cache = snapshot
             cls._cached_at = now
+            cls._failure = ""
             return dict(snapshot)
         except Exception as exc:
-            if cls._cache is not None:
-                stale = dict(cls._cache)
-                stale["stale"] = True
-                stale["error"] = f"Live FX refresh failed ({exc.__class__.__name__}); using last cached rates."
-                return stale
-            return {
-                "rates": {"CHF": 1.0},
-                "as_of": "",
-                "source": "Frankfurter (ECB)",
-                "stale": True,
-                "error": f"Live FX lookup failed ({exc.__class__.__name__}); only CHF values can be converted.",
-            }
+            cls._failed_at = now
+            cls._failure = exc.__class__.__name__
+            return cls._fallback(cls._failure)
+
+    @classmethod
+    def _fallback(cls, failure: str) -> Dict[str, Any]:
+        """Snapshot served while the provider fails: the last rates marked stale, else CHF only."""
+        if cls._cache is not None:
+            stale = dict(cls._cache)
+            stale["stale"] = True
+            stale["error"] = f"Live FX refresh failed ({failure}); using last cached rates."
+            return stale
+        return {
+            "rates": {"CHF": 1.0},
+            "as_of": "",
+            "source": "Frankfurter (ECB)",
+            "stale": True,
+            "error": f"Live FX lookup failed ({failure}); only CHF values can be converted.",
+        }
 
 
 class GoogleSheetsBackend:
@@ -275,14 +415,18 @@ class GoogleSheetsBackend:
         if isinstance(value, (list, dict)):
             return value
         text = str(value or "").strip()
-        if not text:
+        # callers only use list/dict results, which must start with a bracket;
+        # plain names and numbers skip both parsers
+        if not text or text[0] not in "[{":
+            return None
+        try:
+            return _loads(text)
+        except ValueError:
+            pass
+        try:
+            return ast.literal_eval(text)
+        except Exception:
             return None
-        for parser in (json.loads, ast.literal_eval):
-            try:
-                return parser(text)
-            except Exception:
-                continue
-        return None
 
     @classmethod
     def _parse_participants(cls, value: Any) -> List[str]:
@@ -319,71 +463,89 @@ class GoogleSheetsBackend:
         return [p.strip() for p in text.split(",") if p.strip()]
 
     @classmethod
-    def _record_to_expense_dict(cls, record: Dict[str, Any]) -> Dict[str, Any]:
-        shares_raw = record.get("shares_json", record.get("shares", ""))
-        unit = str(record.get("unit", "")).strip() or "EUR"
+    def _cells_to_expense_dict(cls, cells: List[Any]) -> Dict[str, Any]:
+        """Expense dict from one row's cells, given in EXPENSE_HEADERS order."""
+        id_, amount, payer, participants, category, description, unit, shares_raw, date = cells
         return {
-            "id": cls._to_int(record.get("id", 0), 0),
-            "amount": round(cls._to_float(record.get("amount", 0.0), 0.0), 2),
-            "payer": str(record.get("payer", "")).strip(),
-            "participants": cls._parse_participants(record.get("participants", "")),
-            "category": str(record.get("category", "")).strip(),
-            "description": str(record.get("description", "")).strip(),
-            "unit": unit,
+            "id": cls._to_int(id_, 0),
+            "amount": round(cls._to_float(amount, 0.0), 2),
+            "payer": str(payer).strip(),
+            "participants": cls._parse_participants(participants),
+            "category": str(category).strip(),
+            "description": str(description).strip(),
+            "unit": str(unit).strip() or "EUR",
             "shares": cls._parse_shares(shares_raw),
-            "date": str(record.get("date", "")).strip(),
+            "date": str(date).strip(),
         }
 
+    @classmethod
+    def _expense_rows(cls, expenses: List[Dict[str, Any]]) -> List[List[str]]:
+        """
+        Expense dicts as rows of cell values, in EXPENSE_HEADERS order.
+        Each column is built by its own comprehension, then zipped into rows.
+        """
+        to_int, to_float = cls._to_int, cls._to_float
+        columns = (
+            [str(to_int(e.get("id", 0), 0)) for e in expenses],
+            [f"{round(to_float(e.get('amount', 0.0), 0.0), 2):.2f}" for e in expenses],
+            [str(e.get("payer", "") or "") for e in expenses],
+            [_dumps(e.get("participants") or []).decode("utf-8") for e in expenses],
+            [str(e.get("category", "") or "") for e in expenses],
+            [str(e.get("description", "") or "") for e in expenses],
+            [str(e.get("unit", "EUR") or "EUR") for e in expenses],
+            [_dumps(e.get("shares") or {}).decode("utf-8") for e in expenses],
+            [str(e.get("date", "") or "") for e in expenses],
+        )
+        return [list(row) for row in zip(*columns)]
+
+    def append_expenses(self, expenses: List[Dict[str, Any]]) -> bool:
+        """
+        Append expense rows in one append_rows call, without rewriting the sheets.
+        The meta next_id is left alone: load() always bumps it past the highest id.
+        """
+        if not self.available:
+            return False
+        try:
+            self._expenses_ws.append_rows(self._expense_rows(expenses), value_input_option="RAW")
+            return True
+        except Exception:
+            logger.exception("Failed to append expense to Google Sheets")
+            return False
+
     def save_state(self, data: Dict[str, Any]) -> bool:
         if not self.available:
             return False
 
         try:
-            self._ensure_headers()
             expenses = list(data.get("expenses", []) or [])
             categories = list(data.get("categories", []) or [])
             next_id = max(1, self._to_int(data.get("next_id", len(expenses) + 1), len(expenses) + 1))
 
-            expense_rows = [self.EXPENSE_HEADERS]
-            for e in expenses:
-                participants_json = json.dumps(e.get("participants", []) or [], ensure_ascii=False)
-                shares_json = json.dumps(e.get("shares", {}) or {}, ensure_ascii=False)
-                expense_rows.append(
-                    [
-                        str(self._to_int(e.get("id", 0), 0)),
-                        f"{round(self._to_float(e.get('amount', 0.0), 0.0), 2):.2f}",
-                        str(e.get("payer", "") or ""),
-                        participants_json,
-                        str(e.get("category", "") or ""),
-                        str(e.get("description", "") or ""),
-                        str(e.get("unit", "EUR") or "EUR"),
-                        shares_json,
-                        str(e.get("date", "") or ""),
-                    ]
-                )
+            expense_rows = [self.EXPENSE_HEADERS] + self._expense_rows(expenses)
 
             meta_rows = [
                 self.META_HEADERS,
                 ["next_id", str(next_id)],
-                ["categories", json.dumps(categories, ensure_ascii=False)],
+                ["categories", _dumps(categories).decode("utf-8")],
             ]
 
             self._ensure_sheet_size(self._expenses_ws, len(expense_rows) + 10, len(self.EXPENSE_HEADERS))
             self._ensure_sheet_size(self._meta_ws, len(meta_rows) + 5, len(self.META_HEADERS))
 
+            # One batchClear and one batchUpdate cover both worksheets, instead of a
+            # clear() + update() pair per sheet. Headers are row 1 of each payload.
             # Use RAW to store user content as plain values (not spreadsheet formulas).
-            self._expenses_ws.clear()
-            self._expenses_ws.update(
-                range_name="A1",
-                values=expense_rows,
-                value_input_option="RAW",
-            )
-
-            self._meta_ws.clear()
-            self._meta_ws.update(
-                range_name="A1",
-                values=meta_rows,
-                value_input_option="RAW",
+            expenses_range = f"'{self._expenses_ws.title}'"
+            meta_range = f"'{self._meta_ws.title}'"
+            self._spreadsheet.values_batch_clear(body={"ranges": [expenses_range, meta_range]})
+            self._spreadsheet.values_batch_update(
+                {
+                    "valueInputOption": "RAW",
+                    "data": [
+                        {"range": f"{expenses_range}!A1", "values": expense_rows},
+                        {"range": f"{meta_range}!A1", "values": meta_rows},
+                    ],
+                }
             )
             return True
         except Exception:
@@ -402,17 +564,19 @@ class GoogleSheetsBackend:
             if exp_values:
                 raw_headers = exp_values[0]
                 headers = [str(h).strip().lower() for h in raw_headers]
+                # resolve column positions once; later duplicate headers win
+                col_idx = {h: i for i, h in enumerate(headers) if h}
+                if "shares_json" not in col_idx and "shares" in col_idx:
+                    col_idx["shares_json"] = col_idx["shares"]
+                fields = [col_idx.get(h) for h in self.EXPENSE_HEADERS]
+                mapped = sorted(set(col_idx.values()))
                 for row in exp_values[1:]:
-                    if not any(str(c).strip() for c in row):
-                        continue
-                    record: Dict[str, Any] = {}
-                    for idx, header in enumerate(headers):
-                        if not header:
-                            continue
-                        record[header] = row[idx] if idx < len(row) else ""
-                    if not any(record.values()):
+                    n = len(row)
+                    # skip rows with nothing under a known header, or only blank cells
+                    if not any(row[i] for i in mapped if i < n) or not any(str(c).strip() for c in row):
                         continue
-                    expenses.append(self._record_to_expense_dict(record))
+                    cells = [row[i] if i is not None and i < n else "" for i in fields]
+                    expenses.append(self._cells_to_expense_dict(cells))
 
             meta_map: Dict[str, str] = {}
             meta_values = self._meta_ws.get_all_values() or []
@@ -447,23 +611,87 @@ class ExpenseTracker:
         self.expenses: List[Expense] = []
         # category list persisted alongside expenses
         self.categories: List[str] = list(DEFAULT_CATEGORIES)
+        # set mirror of self.categories for membership checks; rebuilt when the list is replaced
+        self._category_set: Set[str] = set()
+        self._category_set_list: Optional[List[str]] = None
         # next id for new expenses
         self._next_id = 1
-        # initialize Google Sheets backend if configured
-        self._gs_backend = GoogleSheetsBackend()
+        # mtime of DATA_FILE as last read/written by this instance (0.0 = never)
+        self._data_mtime = 0.0
+        # mtime of JOURNAL_FILE as last read/written by this instance (0.0 = none)
+        self._journal_mtime = 0.0
+        # ops in JOURNAL_FILE; None when the next local write must be a full save
+        self._journal_ops: Optional[int] = None
+        # time.monotonic() of the last successful Google Sheets load
+        self._last_load_ts = float("-inf")
+        # expenses added since the last save; when nothing else changed, save()
+        # appends just these rows to Google Sheets instead of rewriting both sheets
+        self._pending_appends: List[Expense] = []
+        # ops collected inside batch() (None for a save without an op); None outside a batch
+        self._batch_ops: Optional[List[Optional[Dict[str, Any]]]] = None
+        # bumped on every change to expenses; derived views are cached per version
+        self._version = 0
+        self._cache: Dict[Any, Any] = {}
+        self._cache_version = 0
+        # columnar (SoA) copies of self.expenses for vectorized aggregation; derived
+        # caches rebuilt on demand once _version moves, self.expenses stays authoritative
+        self._arrays = None
+        self._arrays_version = -1
+        self._frame = None
+        self._frame_version = -1
+        # (positions sorted by YYYYMM, sorted YYYYMM keys) for period lookups
+        self._period_index = None
+        self._period_index_version = -1
+        # stripped category -> ascending positions, for the category views
+        self._category_index: Optional[Dict[str, np.ndarray]] = None
+        self._category_index_version = -1
+        # id -> Expense for edit/delete lookups; add/delete keep it in step, and it is
+        # rebuilt whenever self.expenses is replaced (load, clear, reload)
+        self._by_id: Dict[Any, Expense] = {}
+        self._by_id_list: Optional[List[Expense]] = None
+        self._by_id_count = 0
+        # id(expense) -> (expense, expense.to_dict()) so saves re-encode only what changed
+        self._dict_cache: Dict[int, Tuple[Expense, Dict[str, Any]]] = {}
+        # Google Sheets backend, built on first use by _gs(); its availability is
+        # fixed at construction, so it is cached alongside
+        self._gs_backend: Optional[GoogleSheetsBackend] = None
+        self._gs_available = False
+        # the dashboard shares one tracker across sessions: mutators, loads and
+        # cached reads hold this lock (reentrant, as mutators reload and save)
+        self._lock = threading.RLock()
+        # delayed full-state Sheets save (see SHEETS_SAVE_DELAY_SECONDS): the state
+        # captured when it was scheduled, so the timer thread never reads the live
+        # lists; the lock keeps a timer flush and a load-time flush from writing concurrently
+        self._sheets_lock = threading.RLock()
+        self._sheets_pending: Optional[Dict[str, Any]] = None
+        self._sheets_timer: Optional[threading.Timer] = None
         # When running tests, ensure we start from a clean state by removing
         # any temp data file left from previous test runs.
         if any("pytest" in p for p in sys.argv) or os.getenv("PYTEST_CURRENT_TEST"):
-            try:
-                if os.path.exists(DATA_FILE):
-                    os.remove(DATA_FILE)
-            except Exception:
-                pass
+            for path in (DATA_FILE, JOURNAL_FILE):
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except Exception:
+                    pass
         self.load()
 
+    def _gs(self) -> GoogleSheetsBackend:
+        """Return the Google Sheets backend, constructing it on first use."""
+        if self._gs_backend is None:
+            self._gs_backend = GoogleSheetsBackend()
+            self._gs_available = bool(self._gs_backend.available)
+        return self._gs_backend
+
     def uses_google_sheets(self) -> bool:
         """True when the durable Google Sheets backend is active."""
-        return bool(getattr(self, "_gs_backend", None) and self._gs_backend.available)
+        if self._gs_backend is None:
+            self._gs()
+        return self._gs_available
+
+    def data_version(self) -> int:
+        """Change counter of the expense data; UI caches keyed on it go stale with the data."""
+        return self._version
 
     def storage_status(self) -> Tuple[str, str]:
         """
@@ -471,7 +699,7 @@ class ExpenseTracker:
         """
         if self.uses_google_sheets():
             return "google_sheets", "Persistent storage active (Google Sheets)."
-        reason = getattr(self._gs_backend, "reason", "Google Sheets not configured")
+        reason = getattr(self._gs(), "reason", "Google Sheets not configured")
         return "local_json", f"Using local file fallback: {reason}."
 
     def get_fx_snapshot(self, force_refresh: bool = False) -> Dict[str, Any]:
@@ -507,16 +735,16 @@ class ExpenseTracker:
         Returns (grand_total_chf, skipped_amounts_by_unit).
         """
         if expenses is None:
-            expenses = self.list_expenses()
+            return self.grand_total_chf_at(None, rates=rates)
         if rates is None:
             rates = self.get_fx_snapshot().get("rates", {"CHF": 1.0})
 
         total = 0.0
         skipped: Dict[str, float] = {}
         for e in expenses:
-            unit = self._normalize_unit(getattr(e, "unit", "CHF"))
+            unit = self._normalize_unit(e.unit)
             try:
-                amount = float(getattr(e, "amount", 0.0))
+                amount = float(e.amount)
             except Exception:
                 continue
             amount_chf = self.amount_to_chf(amount, unit, rates)
@@ -527,6 +755,132 @@ class ExpenseTracker:
 
         return round(total, 2), skipped
 
+    def grand_total_chf_at(
+        self,
+        positions: Optional[np.ndarray],
+        rates: Optional[Dict[str, float]] = None,
+    ) -> Tuple[float, Dict[str, float]]:
+        """
+        grand_total_chf() for the expenses at positions in self.expenses (all when
+        None), computed on the column arrays: one rate per distinct unit, gathered
+        through unit_idx, instead of a conversion per expense. Results are
+        memoized per _version on the positions and rates.
+        """
+        if rates is None:
+            rates = self.get_fx_snapshot().get("rates", {"CHF": 1.0})
+        key = None if positions is None else np.asarray(positions, dtype=np.int64).tobytes()
+        return self._grand_total_chf_memo(key, tuple(sorted(rates.items())))
+
+    @_versioned_cache(maxsize=POSITIONS_MEMO_SIZE)
+    def _grand_total_chf_memo(self, positions_key: Optional[bytes], rates_items: tuple) -> Tuple[float, Dict[str, float]]:
+        rates = dict(rates_items)
+        a = self._expense_arrays()
+        positions = None if positions_key is None else np.frombuffer(positions_key, dtype=np.int64)
+        amounts, unit_idx = a.amounts, a.unit_idx
+        if positions is not None:
+            amounts, unit_idx = amounts[positions], unit_idx[positions]
+        unit_rates = self._unit_rates(a, rates)
+        labels, label_idx = self._unit_labels(a)
+        if len(labels) == 1:
+            # all expenses share one unit (the common case): a single rate applies
+            # to the plain sum, with no per-row rate gather
+            subtotal = float(amounts.sum())
+            if not np.isnan(unit_rates[0]):
+                return round(subtotal * float(unit_rates[0]), 2), {}
+            return 0.0, ({labels[0]: round(subtotal, 2)} if len(amounts) else {})
+        rate_per_row = unit_rates[unit_idx]
+        known = ~np.isnan(rate_per_row)
+        total = float(np.dot(amounts[known], rate_per_row[known]))
+        # several raw spellings can normalize to one unit, so group by label
+        missing_labels = label_idx[unit_idx[~known]]
+        sums = np.bincount(missing_labels, weights=amounts[~known], minlength=len(labels))
+        present = np.bincount(missing_labels, minlength=len(labels)) > 0
+        skipped = {labels[i]: round(float(sums[i]), 2) for i in np.flatnonzero(present).tolist()}
+        return round(total, 2), skipped
+
+    def _unit_labels(self, a: ExpenseArrays) -> Tuple[List[str], np.ndarray]:
+        """Distinct normalized unit labels, and the label index of every entry of a.units."""
+        labels, label_idx = np.unique(
+            np.array([self._normalize_unit(unit) for unit in a.units], dtype=object), return_inverse=True
+        )
+        return labels.tolist(), label_idx.astype(np.int64)
+
+    def _unit_rates(self, a: ExpenseArrays, rates: Dict[str, float]) -> np.ndarray:
+        """CHF rate per entry of a.units; NaN marks a unit without a usable rate."""
+        rate_vec = np.full(len(a.units), np.nan)
+        for i, unit in enumerate(a.units):
+            rate = rates.get(self._normalize_unit(unit))
+            try:
+                rate_vec[i] = float(rate)
+            except (TypeError, ValueError):
+                pass
+        return rate_vec
+
+    def monthly_totals_chf(
+        self,
+        positions: Optional[np.ndarray],
+        rates: Optional[Dict[str, float]] = None,
+    ) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        """
+        CHF total per (month, category) for the expenses at positions (all when None),
+        as parallel (YYYYMM keys, categories, amounts) sorted by month then category.
+        Undated expenses and units without a rate are left out. Memoized like
+        grand_total_chf_at().
+        """
+        if rates is None:
+            rates = self.get_fx_snapshot().get("rates", {"CHF": 1.0})
+        key = None if positions is None else np.asarray(positions, dtype=np.int64).tobytes()
+        return self._monthly_totals_chf_memo(key, tuple(sorted(rates.items())))
+
+    @_versioned_cache(maxsize=POSITIONS_MEMO_SIZE)
+    def _monthly_totals_chf_memo(
+        self, positions_key: Optional[bytes], rates_items: tuple
+    ) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        a = self._expense_arrays()
+        if positions_key is None:
+            positions = np.arange(len(a.amounts))
+        else:
+            positions = np.frombuffer(positions_key, dtype=np.int64)
+        rate_per_row = self._unit_rates(a, dict(rates_items))[a.unit_idx[positions]]
+        keep = (a.years[positions] > 0) & ~np.isnan(rate_per_row)
+        positions, rate_per_row = positions[keep], rate_per_row[keep]
+        # one group per (month, category), numbered in (month, category name) order
+        n_categories = max(len(a.categories), 1)
+        by_name = np.argsort(np.array(a.categories, dtype=object), kind="stable")
+        rank = np.empty(len(a.categories), dtype=np.int64)
+        rank[by_name] = np.arange(len(a.categories))
+        month_keys = a.years[positions].astype(np.int64) * 100 + a.months[positions]
+        groups, inverse = np.unique(month_keys * n_categories + rank[a.category_idx[positions]], return_inverse=True)
+        sums = np.bincount(inverse, weights=a.amounts[positions] * rate_per_row, minlength=len(groups))
+        categories = [a.categories[by_name[r]] for r in (groups % n_categories).tolist()]
+        return groups // n_categories, categories, sums
+
+    def expense_positions(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        category: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Ascending positions in self.expenses, e.g. for grand_total_chf_at().
+
+        start/end are inclusive YYYYMM month keys; with either given only dated
+        expenses inside the range count. category keeps one (stripped) category.
+        """
+        if start is None and end is None:
+            positions = np.arange(len(self.expenses))
+        else:
+            order, keys = self._expense_period_index()
+            lo = 0 if start is None else int(np.searchsorted(keys, start, side="left"))
+            hi = len(keys) if end is None else int(np.searchsorted(keys, end, side="right"))
+            positions = np.sort(order[lo:hi])
+        if category is not None:
+            in_category = self._expense_category_index().get(category, np.zeros(0, dtype=np.int64))
+            if start is None and end is None:
+                return in_category.copy()
+            positions = positions[np.isin(positions, in_category, assume_unique=True)]
+        return positions
+
     def balances_chf(self, rates: Optional[Dict[str, float]] = None) -> Dict[str, float]:
         """
         Combine per-currency balances into a single CHF balance per participant.
@@ -579,29 +933,7 @@ class ExpenseTracker:
         Produce settle-up suggestions in CHF for a given expense subset.
         """
         balances = self.balances_chf_for_expenses(expenses, rates=rates)
-        creditors = [(p, amt) for p, amt in balances.items() if amt > 0]
-        debtors = [(p, -amt) for p, amt in balances.items() if amt < 0]
-        creditors.sort(key=lambda x: x[1], reverse=True)
-        debtors.sort(key=lambda x: x[1], reverse=True)
-
-        i = j = 0
-        suggestions: List[str] = []
-        while i < len(debtors) and j < len(creditors):
-            d_name, d_amt = debtors[i]
-            c_name, c_amt = creditors[j]
-            pay = round(min(d_amt, c_amt), 2)
-            suggestions.append(f"{d_name} pays {c_name} {pay:.2f} CHF")
-            d_amt -= pay
-            c_amt -= pay
-            if d_amt <= 0.005:
-                i += 1
-            else:
-                debtors[i] = (d_name, d_amt)
-            if c_amt <= 0.005:
-                j += 1
-            else:
-                creditors[j] = (c_name, c_amt)
-        return suggestions
+        return self._settle_lines(balances, "CHF")
 
     def category_totals_chf(
         self,
@@ -618,12 +950,12 @@ class ExpenseTracker:
         totals: Dict[str, float] = {}
         skipped: Dict[str, float] = {}
         for e in expenses:
-            unit = self._normalize_unit(getattr(e, "unit", "CHF"))
+            unit = self._normalize_unit(e.unit)
             try:
-                amount = float(getattr(e, "amount", 0.0))
+                amount = float(e.amount)
             except Exception:
                 continue
-            category = str(getattr(e, "category", "") or "")
+            category = e.category or ""
             amount_chf = self.amount_to_chf(amount, unit, rates)
             if amount_chf is None:
                 skipped[unit] = round(skipped.get(unit, 0.0) + amount, 2)
@@ -636,18 +968,28 @@ class ExpenseTracker:
         year: int,
         month: int,
         rates: Optional[Dict[str, float]] = None,
-    ) -> Tuple[Dict[str, float], Dict[str, float]]:
-        expenses = self.list_expenses(year=year, month=month)
-        return self.category_totals_chf(expenses, rates=rates)
+    ) -> Tuple[Dict[str, float], float, Dict[str, float]]:
+        """Returns (category_totals_chf, grand_total_chf, skipped_amounts_by_unit) for one month."""
+        return self._category_totals_chf_with_total(self.list_expenses(year=year, month=month), rates)
 
     def totals_by_year_chf(
         self,
         year: int,
         rates: Optional[Dict[str, float]] = None,
-    ) -> Tuple[Dict[str, float], Dict[str, float]]:
-        expenses = self.list_expenses(year=year)
-        return self.category_totals_chf(expenses, rates=rates)
+    ) -> Tuple[Dict[str, float], float, Dict[str, float]]:
+        """Returns (category_totals_chf, grand_total_chf, skipped_amounts_by_unit) for one year."""
+        return self._category_totals_chf_with_total(self.list_expenses(year=year), rates)
 
+    def _category_totals_chf_with_total(
+        self,
+        expenses: List[Expense],
+        rates: Optional[Dict[str, float]],
+    ) -> Tuple[Dict[str, float], float, Dict[str, float]]:
+        totals, skipped = self.category_totals_chf(expenses, rates=rates)
+        # the grand total is the sum of the (rounded) category totals shown above it
+        return totals, round(sum(totals.values()), 2), skipped
+
+    @_locked
     def add_expense(
         self,
         amount: float,
@@ -665,8 +1007,7 @@ class ExpenseTracker:
         date: ISO string "YYYY-MM-DD" (UI ensures valid date).
         """
         # Refresh from remote before mutating to reduce stale-session overwrites.
-        if self.uses_google_sheets():
-            self.load()
+        self._refresh_if_stale()
         if shares is None:
             shares = {}
         exp = Expense(
@@ -681,56 +1022,125 @@ class ExpenseTracker:
             date=date,
         )
         self._next_id += 1
+        by_id = self._id_index()
         self.expenses.append(exp)
-        self.save()
+        by_id.setdefault(exp.id, exp)
+        self._by_id_count += 1
+        self._version += 1
+        self._pending_appends.append(exp)
+        d = exp.to_dict()
+        self._dict_cache[id(exp)] = (exp, d)
+        self.save(op={"op": "add", "expense": d, "next_id": self._next_id})
         return exp
 
+    def _refresh_if_stale(self):
+        """
+        Before a write: re-read Google Sheets unless the last load is under
+        SHEETS_REFRESH_SECONDS old; locally, reload when another writer changed
+        DATA_FILE or JOURNAL_FILE, so new ids are allocated past theirs. Inside a
+        batch() the reload is left to the save, which rebases the batch's ops.
+        """
+        if self.uses_google_sheets():
+            if time.monotonic() - self._last_load_ts > SHEETS_REFRESH_SECONDS:
+                self.load()
+        elif self._batch_ops is None and self.local_data_changed():
+            self.reload()
+
     def get_categories(self) -> List[str]:
         """Return a copy of the category list used to populate dropdowns in the UI."""
         return [c for c in self.categories if c not in DEPRECATED_CATEGORIES]
 
+    @_locked
     def add_category(self, name: str) -> bool:
         """
         Persist a new category if it doesn't already exist.
         Returns True when a new category was added, False otherwise.
         """
-        if self.uses_google_sheets():
-            self.load()
+        self._refresh_if_stale()
         name = (name or "").strip()
         if not name:
             return False
         if name in DEPRECATED_CATEGORIES:
             return False
-        if name in self.categories:
+        categories = self._categories_lookup()
+        if name in categories:
             return False
         self.categories.append(name)
-        self.save()
+        categories.add(name)
+        # a lost category is cheap to re-add, so don't pay for an fsync here
+        self.save(durable=False)
         return True
 
+    def _categories_lookup(self) -> Set[str]:
+        """self.categories as a set, kept in step by add_category."""
+        if self._category_set_list is not self.categories or len(self._category_set) != len(self.categories):
+            self._category_set = set(self.categories)
+            self._category_set_list = self.categories
+        return self._category_set
+
     def list_expenses(self, year: Optional[int] = None, month: Optional[int] = None) -> List[Expense]:
         """
         Return the list of expenses, optionally filtered by year and/or month.
-        Date strings in Expense.date are parsed with datetime.date.fromisoformat.
+        Filtering uses the year/month each Expense parsed from its date string.
         Invalid or missing dates are skipped when filtering.
         """
         if year is None and month is None:
             return list(self.expenses)
-        out: List[Expense] = []
-        for e in self.expenses:
-            if not e.date:
-                continue
-            try:
-                d = datetime.date.fromisoformat(e.date)
-            except Exception:
-                # tolerate bad dates in data file
-                continue
-            if year is not None and d.year != year:
-                continue
-            if month is not None and d.month != month:
-                continue
-            out.append(e)
-        return out
+        if year is None:
+            a = self._expense_arrays()
+            positions = np.flatnonzero((a.years > 0) & (a.months == month))
+        else:
+            positions = self._period_positions(year, month)
+        expenses = self.expenses
+        return [expenses[i] for i in positions.tolist()]
+
+    def _period_positions(self, year: int, month: Optional[int] = None) -> np.ndarray:
+        """List positions of the expenses in a year (or one month of it), in list order."""
+        order, keys = self._expense_period_index()
+        # keys are ints, so a period is the half-open range [first, last + 1)
+        if month is None:
+            lo, hi = np.searchsorted(keys, [year * 100, (year + 1) * 100])
+        else:
+            lo, hi = np.searchsorted(keys, [year * 100 + month, year * 100 + month + 1])
+        return np.sort(order[lo:hi])
+
+    def _expense_period_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Secondary index for period filters, rebuilt once per _version: expense
+        positions stably sorted by YYYYMM, plus the matching sorted keys. Expenses
+        without a valid date are left out. self.expenses keeps its own order.
+        """
+        if self._period_index is None or self._period_index_version != self._version:
+            a = self._expense_arrays()
+            valid = np.flatnonzero(a.years > 0)
+            keys = a.years[valid].astype(np.int64) * 100 + a.months[valid]
+            order = np.argsort(keys, kind="stable")
+            self._period_index = (valid[order], keys[order])
+            self._period_index_version = self._version
+        return self._period_index
+
+    def _expense_category_index(self) -> Dict[str, np.ndarray]:
+        """
+        Secondary index for category filters, rebuilt once per _version: each
+        stripped category name mapped to its ascending positions in self.expenses.
+        """
+        if self._category_index is None or self._category_index_version != self._version:
+            a = self._expense_arrays()
+            # fold category codes whose names only differ in surrounding whitespace
+            names: Dict[str, int] = {}
+            fold = np.array(
+                [names.setdefault(str(name).strip(), len(names)) for name in a.categories], dtype=np.int64
+            )
+            groups = fold[a.category_idx]
+            order = np.argsort(groups, kind="stable")
+            bounds = np.searchsorted(groups[order], np.arange(len(names) + 1))
+            self._category_index = {
+                name: order[bounds[g]:bounds[g + 1]] for name, g in names.items() if bounds[g + 1] > bounds[g]
+            }
+            self._category_index_version = self._version
+        return self._category_index
 
+    @_locked
     def clear(self):
         """
         Reset tracker state: clear expenses, reset categories to default and next_id.
@@ -739,44 +1149,231 @@ class ExpenseTracker:
         self.expenses = []
         self.categories = list(DEFAULT_CATEGORIES)
         self._next_id = 1
+        self._version += 1
         self.save()
 
-    def save(self):
+    def save(self, durable: Optional[bool] = None, op: Optional[Dict[str, Any]] = None):
         """
         Persist tracker state as JSON atomically.
         Logs the target path so we can verify the file being written.
+        durable: fsync the local file before the rename; defaults to TRACKER_FSYNC (off).
+        Without fsync the write still lands atomically via the rename, but a power loss
+        shortly after a save can lose that save. Set TRACKER_FSYNC=1 when that matters.
+        op: the single add/edit/delete that caused this save. Locally it is appended
+        to JOURNAL_FILE instead of rewriting DATA_FILE, until compaction is due.
+        On Google Sheets, new rows are appended right away; full-state writes wait
+        SHEETS_SAVE_DELAY_SECONDS for further edits (call flush() to force them).
         """
-        data = {
+        if self._batch_ops is not None:
+            self._batch_ops.append(op)
+            return
+        self._save_ops([op], durable)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Group several mutations into one save on exit, e.g. a form that adds a
+        category and then an expense. Locally the ops still reach the journal, in
+        one write; nested batches fold into the outermost one.
+        """
+        with self._lock:
+            if self._batch_ops is not None:
+                yield self
+                return
+            self._batch_ops = []
+            try:
+                yield self
+            finally:
+                ops, self._batch_ops = self._batch_ops, None
+                if ops:
+                    self._save_ops(ops, None)
+
+    def _save_ops(self, ops: List[Optional[Dict[str, Any]]], durable: Optional[bool]):
+        """save() for the mutations in ops; an op of None asks for a full save."""
+        if durable is None:
+            durable = TRACKER_FSYNC
+        pending, self._pending_appends = self._pending_appends, []
+        only_adds = all(op is not None and op.get("op") == "add" for op in ops)
+        # a delayed full save still pending would rewrite the sheet from its older
+        # snapshot and drop appended rows, so adds then reschedule it with them included
+        if pending and only_adds and self._sheets_pending is None and self.uses_google_sheets():
+            logger.info("Appending %d expense(s) to Google Sheets", len(pending))
+            if self._gs().append_expenses([e.to_dict() for e in pending]):
+                return
+            logger.warning("Google Sheets append failed, rewriting full state")
+
+        if self.uses_google_sheets():
+            if SHEETS_SAVE_DELAY_SECONDS > 0:
+                self._schedule_sheets_save()
+                return
+            if self._save_to_sheets():
+                return
+
+        # Fallback to local JSON file
+        if None not in ops:
+            if self.local_data_changed():
+                # another writer got in since this instance last read the files
+                ops = self._rebase_ops(ops)
+            if self._append_journal(ops, durable):
+                return
+        self._write_local(durable)
+
+    def _rebase_ops(self, ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Redo ops made on a stale view on top of the files as another writer left
+        them: reload, then re-add every added expense under a freshly allocated id
+        (the Expense handed to the caller is updated in place), apply edits to
+        expenses that still exist and drop deletes of ones already gone. Later ops
+        on an expense re-added here follow it to its new id.
+        Returns the ops to journal.
+        """
+        stale = dict(self._id_index())
+        self.reload()
+        rebased: List[Dict[str, Any]] = []
+        # stale id -> id handed out by this rebase
+        new_ids: Dict[Any, int] = {}
+        for op in ops:
+            kind = op.get("op")
+            if kind == "add":
+                d = op.get("expense") or {}
+                old_key = self._id_key(d.get("id"))
+                e = stale.get(old_key) or Expense.from_dict(d)
+                e.id = new_ids[old_key] = self._next_id
+                self._next_id += 1
+                self.expenses.append(e)
+                d = e.to_dict()
+                self._dict_cache[id(e)] = (e, d)
+                rebased.append({"op": "add", "expense": d, "next_id": self._next_id})
+                continue
+            key = self._id_key((op.get("expense") or {}).get("id") if kind == "edit" else op.get("id"))
+            readded = key in new_ids
+            if readded:
+                key = new_ids[key]
+            current = self._id_index().get(key)
+            if current is None:
+                logger.warning("Dropping %s of expense id=%s removed by another writer", kind, key)
+                continue
+            i = self._list_position(current, key)
+            if kind == "edit":
+                if readded:
+                    # the caller's Expense, already edited in place and re-added above
+                    rebased.append({"op": "edit", "expense": self._dict_cache[id(current)][1]})
+                    continue
+                self.expenses[i] = e = Expense.from_dict(op["expense"])
+                self._dict_cache[id(e)] = (e, op["expense"])
+                rebased.append(op)
+            else:
+                self.expenses.pop(i)
+                rebased.append({"op": "delete", "id": key, "next_id": self._next_id})
+            self._by_id_list = None
+        self._version += 1
+        return rebased
+
+    def _state(self) -> Dict[str, Any]:
+        return {
             "next_id": self._next_id,
-            "expenses": [e.to_dict() for e in self.expenses],
-            "categories": self.categories,
+            "expenses": self._expense_dicts(),
+            "categories": list(self.categories),
         }
 
-        # If Google Sheets backend is configured and available, use it.
+    def _expense_dicts(self) -> List[Dict[str, Any]]:
+        """to_dict() of every expense, reusing the dicts of expenses unchanged since the last call."""
+        old, new = self._dict_cache, {}
+        out = []
+        for e in self.expenses:
+            hit = old.get(id(e))
+            # the cache holds a reference to e, so a match by id() is always the same object
+            if hit is None or hit[0] is not e:
+                hit = (e, e.to_dict())
+            new[id(e)] = hit
+            out.append(hit[1])
+        # dropping entries for expenses no longer in the list
+        self._dict_cache = new
+        return out
+
+    def _save_to_sheets(self, state: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Push the full state (or a snapshot of it taken earlier) to Google Sheets;
+        False means the caller should fall back to local JSON.
+        """
+        if state is None:
+            state = self._state()
         try:
-            if getattr(self, "_gs_backend", None) and self._gs_backend.available:
-                logger.info("Saving data to Google Sheets (expenses=%d)", len(self.expenses))
-                ok = self._gs_backend.save_state(data)
-                if ok:
-                    return
-                else:
-                    logger.warning("Google Sheets save failed, falling back to local JSON")
+            logger.info("Saving data to Google Sheets (expenses=%d)", len(state["expenses"]))
+            if self._gs().save_state(state):
+                return True
+            logger.warning("Google Sheets save failed, falling back to local JSON")
         except Exception:
             logger.exception("Error while attempting to save to Google Sheets; falling back to local JSON")
+        return False
 
-        # Fallback to local JSON file
-        os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-        target = os.path.abspath(DATA_FILE)
-        logger.info(f"Saving data to {target} (expenses={len(self.expenses)})")
+    def _schedule_sheets_save(self):
+        """
+        Snapshot the state and (re)start the timer for a delayed Sheets save of it.
+        The expense dicts are never mutated once built, so the snapshot only copies
+        the lists. An edit made within SHEETS_SAVE_DELAY_SECONDS of a crash (or a
+        kill that skips atexit) is lost; set the delay to 0 when that matters.
+        """
+        state = self._state()
+        with self._sheets_lock:
+            self._sheets_pending = state
+            _SHEETS_DIRTY.add(self)
+            if self._sheets_timer is not None:
+                self._sheets_timer.cancel()
+            self._sheets_timer = threading.Timer(SHEETS_SAVE_DELAY_SECONDS, self._flush_from_timer)
+            self._sheets_timer.daemon = True
+            self._sheets_timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Delayed save failed")
+
+    def flush(self):
+        """
+        Write a delayed Google Sheets save now, if one is pending. Loads and process
+        exit call this, so a pending save is never lost to a re-read; falls back to
+        local JSON when Sheets refuses the write.
+        """
+        with self._sheets_lock:
+            if self._sheets_timer is not None:
+                self._sheets_timer.cancel()
+                self._sheets_timer = None
+            state, self._sheets_pending = self._sheets_pending, None
+            if state is None:
+                return
+            _SHEETS_DIRTY.discard(self)
+            if not self._save_to_sheets(state):
+                self._write_local(TRACKER_FSYNC, state)
+
+    def _write_local(self, durable: bool, data: Optional[Dict[str, Any]] = None):
+        """Atomically rewrite DATA_FILE with the full state (or the given snapshot of it) and drop the journal."""
+        if data is None:
+            data = self._state()
+        target = _DATA_FILE_ABS
+        logger.info(f"Saving data to {target} (expenses={len(data['expenses'])})")
         # atomic write: write to temp file then move
-        dirn = os.path.dirname(target)
-        fd, tmp_path = tempfile.mkstemp(prefix="tmp_expenses_", dir=dirn, text=True)
         try:
-            with os.fdopen(fd, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
-                f.flush()
-                os.fsync(f.fileno())
-            shutil.move(tmp_path, target)
+            fd, tmp_path = tempfile.mkstemp(prefix="tmp_expenses_", dir=_DATA_DIR)
+        except FileNotFoundError:
+            # first save into a data directory that doesn't exist yet
+            os.makedirs(_DATA_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix="tmp_expenses_", dir=_DATA_DIR)
+        try:
+            with os.fdopen(fd, "wb", buffering=1 << 20) as f:
+                _json_dump_file(data, f, indent=TRACKER_PRETTY)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, target)
+            self._data_mtime = os.path.getmtime(target)
+            # the snapshot now holds every journaled op
+            try:
+                os.remove(JOURNAL_FILE)
+            except FileNotFoundError:
+                pass
+            self._journal_ops, self._journal_mtime = 0, 0.0
         except Exception as exc:
             logger.exception("Failed to save data file")
             # try to remove tmp file if present
@@ -787,31 +1384,143 @@ class ExpenseTracker:
                 pass
             raise
 
+    def _append_journal(self, ops: List[Dict[str, Any]], durable: bool) -> bool:
+        """
+        Append one line per op to JOURNAL_FILE. Returns False when a full save is due
+        instead: no usable snapshot, DATA_FILE or JOURNAL_FILE changed on disk since
+        we read them, or the journal has grown past JOURNAL_COMPACT_OPS / twice the snapshot.
+        """
+        if self._journal_ops is None or self._journal_ops >= JOURNAL_COMPACT_OPS:
+            return False
+        try:
+            if self.local_data_changed():
+                return False
+            if self._journal_ops and os.path.getsize(JOURNAL_FILE) > 2 * os.path.getsize(DATA_FILE):
+                return False
+        except OSError:
+            return False
+        with open(JOURNAL_FILE, "ab") as f:
+            f.write(b"".join(_dumps(op) + b"\n" for op in ops))
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        self._journal_ops += len(ops)
+        self._journal_mtime = os.path.getmtime(JOURNAL_FILE)
+        return True
+
+    @staticmethod
+    def _id_key(expense_id: Any) -> Any:
+        try:
+            return int(float(expense_id))
+        except Exception:
+            return expense_id
+
+    def _list_position(self, expense: Expense, key: Any) -> int:
+        """
+        Index of expense in self.expenses. Ids grow along the list (ids come from a
+        monotonic counter and new expenses are appended), so a binary search by id
+        normally lands on it; anything else falls back to an identity scan.
+        """
+        try:
+            i = bisect.bisect_left(self.expenses, key, key=lambda e: self._id_key(e.id))
+            if i < len(self.expenses) and self.expenses[i] is expense:
+                return i
+        except TypeError:
+            # ids that don't compare with ints (malformed data)
+            pass
+        return next(i for i, e in enumerate(self.expenses) if e is expense)
+
+    def _id_index(self) -> Dict[Any, Expense]:
+        """id -> Expense for self.expenses (first one wins on duplicate ids)."""
+        if self._by_id_list is not self.expenses or self._by_id_count != len(self.expenses):
+            by_id: Dict[Any, Expense] = {}
+            for e in self.expenses:
+                by_id.setdefault(self._id_key(e.id), e)
+            self._by_id, self._by_id_list, self._by_id_count = by_id, self.expenses, len(self.expenses)
+        return self._by_id
+
+    def _replay_journal(self, data: Dict[str, Any]) -> Optional[int]:
+        """
+        Apply JOURNAL_FILE ops to freshly read snapshot data in place. Returns the op
+        count, or None after a torn line so the next write compacts instead of appending.
+        """
+        if not os.path.exists(JOURNAL_FILE):
+            return 0
+        expenses: List[Optional[Dict[str, Any]]] = list(data.get("expenses", []) or [])
+        pos = {self._id_key(d.get("id")): i for i, d in enumerate(expenses)}
+        next_id = GoogleSheetsBackend._to_int(data.get("next_id", 1), 1)
+        ops = 0
+        torn = False
+        with open(JOURNAL_FILE, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    op = _loads(line)
+                except ValueError:
+                    # a torn last line from an interrupted append
+                    logger.warning("Skipping unreadable journal line")
+                    torn = True
+                    continue
+                ops += 1
+                kind = op.get("op")
+                if kind in ("add", "edit"):
+                    d = op.get("expense") or {}
+                    key = self._id_key(d.get("id"))
+                    if kind == "add" and key in pos:
+                        # two writers handed out the same id; the first add wins
+                        logger.warning("Skipping journaled add of existing expense id=%s", key)
+                        continue
+                    if key in pos:
+                        expenses[pos[key]] = d
+                    else:
+                        pos[key] = len(expenses)
+                        expenses.append(d)
+                elif kind == "delete":
+                    i = pos.pop(self._id_key(op.get("id")), None)
+                    if i is not None:
+                        expenses[i] = None
+                next_id = max(next_id, GoogleSheetsBackend._to_int(op.get("next_id", 0), 0))
+        data["expenses"] = [d for d in expenses if d is not None]
+        data["next_id"] = next_id
+        self._journal_mtime = os.path.getmtime(JOURNAL_FILE)
+        return None if torn else ops
+
+    @_locked
     def load(self):
         """
         Load tracker state from Google Sheets when configured, otherwise local JSON.
         If no saved data exists, defaults remain (empty expenses, default categories).
         IDs are kept stable; _next_id is set to at least max(existing_id) + 1.
         """
+        self._version += 1
         # Try Google Sheets backend first
         try:
-            if getattr(self, "_gs_backend", None) and self._gs_backend.available:
+            if self.uses_google_sheets():
+                # delayed saves from this or any other tracker must land before we re-read
+                _flush_sheets_saves()
                 logger.info("Loading data from Google Sheets")
-                data = self._gs_backend.load_state() or {}
+                data = self._gs().load_state() or {}
+                if data:
+                    self._last_load_ts = time.monotonic()
             else:
                 data = None
         except Exception:
             logger.exception("Error loading from Google Sheets, falling back to local JSON")
             data = None
 
-        if not data:
+        from_local = not data
+        if from_local:
+            self._journal_ops, self._journal_mtime = None, 0.0
             if not os.path.exists(DATA_FILE):
                 return
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = _json_load_file(DATA_FILE)
+            self._data_mtime = os.path.getmtime(DATA_FILE)
+            self._journal_ops = self._replay_journal(data)
 
         # build Expense objects from data and normalize malformed ids.
         self.expenses = [Expense.from_dict(d) for d in data.get("expenses", [])]
+        self._dict_cache = {}
         max_id = 0
         for exp in self.expenses:
             try:
@@ -821,6 +1530,8 @@ class ExpenseTracker:
             if exp_id <= 0:
                 max_id += 1
                 exp.id = max_id
+                # the snapshot doesn't know this id, so journal ops couldn't refer to it
+                self._journal_ops = None
             else:
                 max_id = max(max_id, exp_id)
 
@@ -832,16 +1543,39 @@ class ExpenseTracker:
         self._next_id = max(next_id_raw, max_id + 1)
         # restore categories: ensure DEFAULT_CATEGORIES are present (prepend defaults)
         loaded_cats = [c for c in (data.get("categories", []) or []) if c not in DEPRECATED_CATEGORIES]
-        merged = []
-        for c in DEFAULT_CATEGORIES:
-            if c in loaded_cats:
-                merged.append(c)
-        # append any other loaded categories preserving their order
-        for c in loaded_cats:
-            if c not in merged:
-                merged.append(c)
+        loaded_set = set(loaded_cats)
+        # dict keys give an ordered set: defaults first, then other loaded categories in order
+        merged = dict.fromkeys(c for c in DEFAULT_CATEGORIES if c in loaded_set)
+        merged.update(dict.fromkeys(loaded_cats))
         # if no categories were loaded, fall back to defaults
-        self.categories = merged or list(DEFAULT_CATEGORIES)
+        self.categories = list(merged) or list(DEFAULT_CATEGORIES)
+
+    @_locked
+    def reload(self):
+        """Discard in-memory state and re-read it from the active backend."""
+        self.expenses = []
+        self.categories = list(DEFAULT_CATEGORIES)
+        self._next_id = 1
+        self.load()
+
+    @_locked
+    def refresh(self):
+        """
+        Bring a long-lived instance up to date before a rerun reads it: reload when
+        another process changed the local files, re-read Google Sheets once the
+        last load is over SHEETS_REFRESH_SECONDS old.
+        """
+        if self.local_data_changed():
+            self.reload()
+        else:
+            self._refresh_if_stale()
+
+    def local_data_changed(self) -> bool:
+        """True when DATA_FILE or JOURNAL_FILE was modified by someone else since this instance last read/wrote it."""
+        if self.uses_google_sheets() or not os.path.exists(DATA_FILE):
+            return False
+        journal_mtime = os.path.getmtime(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0.0
+        return os.path.getmtime(DATA_FILE) != self._data_mtime or journal_mtime != self._journal_mtime
 
     def _balances_from_expenses(self, expenses: List[Expense]) -> Dict[str, Dict[str, float]]:
         """
@@ -858,43 +1592,47 @@ class ExpenseTracker:
             - Positive balance => participant should receive money.
             - Negative balance => participant owes money.
         """
-        result: Dict[str, Dict[str, float]] = {}
-        for e in expenses:
-            unit = getattr(e, "unit", "EUR") or "EUR"
-            bal = result.setdefault(unit, {})
-            if e.shares:
-                # custom-per-person amounts
-                for p, s in e.shares.items():
-                    bal.setdefault(p, 0.0)
-                    bal[p] -= round(s, 2)
-            else:
-                participants = e.participants
-                if not participants:
-                    continue
-                share = round(e.amount / len(participants), 2)
-                for p in participants:
-                    bal.setdefault(p, 0.0)
-                    bal[p] -= share
-            # payer receives the expense amount
-            bal.setdefault(e.payer, 0.0)
-            bal[e.payer] += round(e.amount, 2)
-
-        # normalize small rounding noise and round to 2 decimals
-        for unit, balances in result.items():
-            for p, v in list(balances.items()):
-                if abs(v) < 0.005:
-                    balances[p] = 0.0
-                else:
-                    balances[p] = round(v, 2)
-        return result
+        # vectorized: flatten into per-share rows and reduce with np.bincount
+        if not expenses:
+            return {}
+        return compute_balances(expenses_to_arrays(expenses))
 
+    @_versioned_cache
     def balances(self) -> Dict[str, Dict[str, float]]:
-        return self._balances_from_expenses(self.expenses)
+        if not self.expenses:
+            return {}
+        return compute_balances(self._expense_arrays())
+
+    @_versioned_cache
+    def balances_by_year(self) -> Dict[int, Dict[str, Dict[str, float]]]:
+        """
+        balances_for_expenses(list_expenses(year=y)) for every year with dated
+        expenses ({year: {unit: {person: balance}}}), from a single pass.
+        """
+        return compute_balances_by_year(self._expense_arrays())
 
     def balances_for_expenses(self, expenses: List[Expense]) -> Dict[str, Dict[str, float]]:
         """Public helper to compute balances for a provided expense subset."""
         return self._balances_from_expenses(expenses)
 
+    @staticmethod
+    def _settle_lines(balances: Dict[str, float], unit: str) -> List[str]:
+        """
+        Greedy settle-up for one set of balances: the largest remaining debtor pays
+        the largest remaining creditor until all are settled. Matching runs on
+        integer cents in src._settle_numba; strings are only formatted at the end.
+        """
+        names = list(balances)
+        cents = np.rint(np.fromiter(balances.values(), dtype=np.float64, count=len(names)) * 100).astype(np.int64)
+        # kept in balance order, which the matcher uses to break ties
+        debtors = np.flatnonzero(cents < 0)
+        creditors = np.flatnonzero(cents > 0)
+        matches = match_settlements(-cents[debtors], cents[creditors])
+        return [
+            f"{names[debtors[d]]} pays {names[creditors[c]]} {pay / 100:.2f} {unit}"
+            for d, c, pay in matches.tolist()
+        ]
+
     @staticmethod
     def _settle_suggestions_from_balances(balances_by_unit: Dict[str, Dict[str, float]]) -> Dict[str, List[str]]:
         """
@@ -905,118 +1643,139 @@ class ExpenseTracker:
           - Sort descending and greedily match largest creditor with largest debtor
           - Produce strings like "Morgan pays Alessio 12.34 EUR"
         """
-        suggestions_by_unit: Dict[str, List[str]] = {}
-        for unit, bal in balances_by_unit.items():
-            creditors = [(p, amt) for p, amt in bal.items() if amt > 0]
-            debtors = [(p, -amt) for p, amt in bal.items() if amt < 0]  # store positive owed for debtors
-            creditors.sort(key=lambda x: x[1], reverse=True)
-            debtors.sort(key=lambda x: x[1], reverse=True)
-            i = j = 0
-            suggestions: List[str] = []
-            while i < len(debtors) and j < len(creditors):
-                d_name, d_amt = debtors[i]
-                c_name, c_amt = creditors[j]
-                pay = round(min(d_amt, c_amt), 2)
-                suggestions.append(f"{d_name} pays {c_name} {pay:.2f} {unit}")
-                d_amt -= pay
-                c_amt -= pay
-                if d_amt <= 0.005:
-                    i += 1
-                else:
-                    debtors[i] = (d_name, d_amt)
-                if c_amt <= 0.005:
-                    j += 1
-                else:
-                    creditors[j] = (c_name, c_amt)
-            suggestions_by_unit[unit] = suggestions
-        return suggestions_by_unit
+        return {unit: ExpenseTracker._settle_lines(bal, unit) for unit, bal in balances_by_unit.items()}
 
+    @_versioned_cache
     def settle_suggestions(self) -> Dict[str, List[str]]:
         return self._settle_suggestions_from_balances(self.balances())
 
-    def available_periods(self) -> Tuple[List[int], Dict[int, List[int]]]:
+    @_versioned_cache
+    def category_counts(self) -> List[Tuple[str, int]]:
+        """
+        (category, number of expenses) for every non-blank (stripped) category,
+        most used first, ties by name.
+        """
+        counts = [(name, len(positions)) for name, positions in self._expense_category_index().items() if name]
+        return sorted(counts, key=lambda item: (-item[1], item[0]))
+
+    @_versioned_cache
+    def available_periods(self, category: Optional[str] = None) -> Tuple[List[int], Dict[int, List[int]]]:
         """
         Inspect all expenses and return available years and the months per year.
+        With category, only periods holding an expense of that (stripped) category count.
 
         Returns:
             (years_list, { year: [month1, month2, ...], ... })
         Useful for populating year/month filters in the UI.
         """
-        years = set()
-        months_by_year = defaultdict(set)
-        for e in self.expenses:
-            if not e.date:
-                continue
-            try:
-                d = datetime.date.fromisoformat(e.date)
-            except Exception:
-                continue
-            years.add(d.year)
-            months_by_year[d.year].add(d.month)
-        years_list = sorted(years)
-        months_map = {y: sorted(list(months_by_year[y])) for y in years_list}
-        return years_list, months_map
-
+        positions, keys = self._expense_period_index()
+        if category is not None:
+            in_category = self._expense_category_index().get(category, np.zeros(0, dtype=np.int64))
+            keys = keys[np.isin(positions, in_category, assume_unique=True)]
+        # the index keys are already sorted: keep the first key of every run
+        periods = keys[np.r_[True, keys[1:] != keys[:-1]]].tolist() if len(keys) else []
+        months_map: Dict[int, List[int]] = {}
+        for p in periods:
+            months_map.setdefault(p // 100, []).append(p % 100)
+        return list(months_map), months_map
+
+    @_versioned_cache
     def totals_by_month(self, year: int, month: int) -> Dict[str, Dict[str, float]]:
         """
         Aggregate totals by currency unit and category for a specific month.
         Output: { unit: { category: total_amount, ... }, ... }
         """
-        totals: Dict[str, Dict[str, float]] = {}
-        for e in self.list_expenses(year=year, month=month):
-            unit = getattr(e, "unit", "EUR") or "EUR"
-            m = totals.setdefault(unit, {})
-            m[e.category] = round(m.get(e.category, 0.0) + e.amount, 2)
-        return totals
+        # only the month's rows are touched, found through the period index
+        return self._category_totals(self._expense_frame().take(self._period_positions(year, month)))
 
+    @_versioned_cache
     def totals_by_year(self, year: int) -> Dict[str, Dict[str, float]]:
         """
         Aggregate totals by currency unit and category for a whole year.
         """
+        return self._category_totals(self._expense_frame().take(self._period_positions(year)))
+
+    def _expense_arrays(self) -> ExpenseArrays:
+        """self.expenses as parallel numpy columns (see src.storage.ExpenseArrays), built once per _version."""
+        if self._arrays is None or self._arrays_version != self._version:
+            self._arrays = expenses_to_arrays(self.expenses)
+            self._arrays_version = self._version
+        return self._arrays
+
+    def _expense_frame(self):
+        """
+        The expense columns as one pandas DataFrame (amount, unit, category, year, month).
+        Built once per _version; pandas is imported on first use only.
+        """
+        if self._frame is None or self._frame_version != self._version:
+            import pandas as pd
+
+            a = self._expense_arrays()
+            self._frame = pd.DataFrame(
+                {
+                    "amount": a.amounts,
+                    "unit": np.asarray(a.units, dtype=object)[a.unit_idx],
+                    "category": np.asarray(a.categories, dtype=object)[a.category_idx],
+                    "year": a.years,
+                    "month": a.months,
+                }
+            )
+            self._frame_version = self._version
+        return self._frame
+
+    @staticmethod
+    def _category_totals(df) -> Dict[str, Dict[str, float]]:
+        """{unit: {category: total}} from a frame slice, in first-seen order."""
+        sums = df.groupby(["unit", "category"], sort=False)["amount"].sum().round(2)
         totals: Dict[str, Dict[str, float]] = {}
-        for e in self.list_expenses(year=year):
-            unit = getattr(e, "unit", "EUR") or "EUR"
-            m = totals.setdefault(unit, {})
-            m[e.category] = round(m.get(e.category, 0.0) + e.amount, 2)
+        for (unit, category), amount in sums.items():
+            totals.setdefault(unit, {})[category] = float(amount)
         return totals
 
     # -----------------------
     # Edit / delete helpers
     # -----------------------
+    @_locked
     def edit_expense(self, expense_id: int, **kwargs) -> Optional[Expense]:
         """
         Update an existing expense fields. Supported kwargs:
         amount, payer, participants, category, description, unit, shares, date.
         Returns the updated Expense or None if id not found.
         """
-        if self.uses_google_sheets():
-            self.load()
-        for e in self.expenses:
-            if e.id == expense_id:
-                for key in ("amount", "payer", "participants", "category", "description", "unit", "shares", "date"):
-                    if key in kwargs:
-                        setattr(e, key, kwargs[key])
-                # ensure numeric rounding for amount and shares
-                try:
-                    e.amount = round(float(e.amount), 2)
-                except Exception:
-                    pass
-                if getattr(e, "shares", None):
-                    try:
-                        e.shares = {p: round(float(v), 2) for p, v in e.shares.items()}
-                    except Exception:
-                        pass
-                self.save()
-                return e
-        return None
+        self._refresh_if_stale()
+        e = self._id_index().get(self._id_key(expense_id))
+        if e is None:
+            return None
+        for key in ("amount", "payer", "participants", "category", "description", "unit", "shares", "date"):
+            if key in kwargs:
+                setattr(e, key, kwargs[key])
+        e.participants = tuple(e.participants or ())
+        e.unit = (e.unit or "").strip() or "EUR"
+        e.shares = e.shares or {}
+        e.refresh_period()
+        self._version += 1
+        # ensure numeric rounding for amount and shares
+        try:
+            e.amount = round(float(e.amount), 2)
+        except Exception:
+            pass
+        if e.shares:
+            try:
+                e.shares = {p: round(float(v), 2) for p, v in e.shares.items()}
+            except Exception:
+                pass
+        d = e.to_dict()
+        self._dict_cache[id(e)] = (e, d)
+        self.save(op={"op": "edit", "expense": d})
+        return e
 
+    @_locked
     def delete_expense(self, expense_id: int) -> bool:
         """Remove expense by id. Returns True if deleted, False if not found.
 
-        IDs are not renumbered, to keep references stable across sessions.
+        IDs are never renumbered or reused, so references stay stable across sessions.
         """
-        if self.uses_google_sheets():
-            self.load()
+        self._refresh_if_stale()
         try:
             # coerce types to int for reliable comparison
             target_id = int(expense_id)
@@ -1025,42 +1784,30 @@ class ExpenseTracker:
             return False
 
         logger.info("Attempting to delete expense id=%s", target_id)
-        for i, e in enumerate(self.expenses):
-            try:
-                e_id = int(e.id)
-            except Exception:
-                # try to handle bad stored id formats
-                try:
-                    e_id = int(float(e.id))
-                except Exception:
-                    continue
-            if e_id == target_id:
-                removed = self.expenses.pop(i)
-                # Keep next id monotonic to avoid id reuse.
-                max_existing = 0
-                for exp in self.expenses:
-                    try:
-                        max_existing = max(max_existing, int(exp.id))
-                    except Exception:
-                        continue
-                self._next_id = max(self._next_id, max_existing + 1)
-                try:
-                    # persist changes
-                    self.save()
-                    logger.info("Deleted expense id=%s (category=%s, amount=%s). Remaining expenses=%d.",
-                                target_id, getattr(removed, "category", ""), getattr(removed, "amount", ""), len(self.expenses))
-                    return True
-                except Exception:
-                    logger.exception("Error saving after delete")
-                    # restore in-memory list if save failed
-                    self.expenses.insert(i, removed)
-                    max_existing = 0
-                    for exp in self.expenses:
-                        try:
-                            max_existing = max(max_existing, int(exp.id))
-                        except Exception:
-                            continue
-                    self._next_id = max(self._next_id, max_existing + 1)
-                    return False
-        logger.info("Expense id=%s not found", target_id)
-        return False
+        by_id = self._id_index()
+        removed = by_id.get(target_id)
+        if removed is None:
+            logger.info("Expense id=%s not found", target_id)
+            return False
+        i = self._list_position(removed, target_id)
+        self.expenses.pop(i)
+        del by_id[target_id]
+        self._by_id_count -= 1
+        if len(by_id) != self._by_id_count:
+            # duplicate ids: another expense may now answer for target_id
+            self._by_id_list = None
+        self._version += 1
+        # _next_id already exceeds every id and is never lowered, so freed ids aren't reused
+        try:
+            # persist changes
+            self.save(op={"op": "delete", "id": target_id, "next_id": self._next_id})
+            logger.info("Deleted expense id=%s (category=%s, amount=%s). Remaining expenses=%d.",
+                        target_id, getattr(removed, "category", ""), getattr(removed, "amount", ""), len(self.expenses))
+            return True
+        except Exception:
+            logger.exception("Error saving after delete")
+            # restore in-memory list if save failed
+            self.expenses.insert(i, removed)
+            self._by_id_list = None
+            self._version += 1
+            return False
@@ -0,0 +1,21 @@
+"""
+src.ui - Streamlit UI modules
+
+dashboard and components are loaded lazily on first attribute access (PEP 562).
+"""
+
+import importlib
+
+__all__ = ["components", "dashboard"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
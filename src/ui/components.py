@@ -2,7 +2,7 @@
 components.py - reusable Streamlit components / forms / displays
 
 This module contains pure-UI helpers used by the dashboard:
- - display_expense_form(on_submit, categories, add_category_cb)
+ - display_expense_form(on_submit, categories, add_category_cb, batch)
  - display_expense_list / balances / settle suggestions / category totals
 
 The form enforces validation rules:
@@ -15,39 +15,51 @@ The form enforces validation rules:
 """
 
 from dataclasses import dataclass
-from typing import Dict, List, Callable, Optional, Any
+from typing import Dict, List, Callable, ContextManager, Optional, Any
 from src.models import Expense
 from src.tracker import DEFAULT_CATEGORIES
+import contextlib
 import datetime
 import streamlit as st
 import pandas as pd
 from io import BytesIO
+from collections import defaultdict
+import functools
 import json
-import time
 import altair as alt
 
-# Trigger a Streamlit rerun in a way compatible with multiple Streamlit versions.
-def _trigger_rerun():
-    # Prefer direct experimental rerun if available
-    try:
-        if hasattr(st, "experimental_rerun"):
-            st.experimental_rerun()
-            return
-    except Exception:
-        pass
-    # Fallback: mutate query params to force a rerun (use st.query_params API)
-    try:
-        params = dict(st.query_params or {})
-        params["_rerun"] = [str(int(time.time()))]
-        st.query_params = params
-        return
-    except Exception:
-        pass
-    # Last resort: toggle a session_state key
-    try:
-        st.session_state["_rerun_flag"] = st.session_state.get("_rerun_flag", 0) + 1
-    except Exception:
-        pass
+# orjson is optional; the stdlib fallback writes the same compact JSON
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# xlsxwriter writes the export without openpyxl's in-memory cell tree; openpyxl
+# remains the fallback when it isn't installed
+try:
+    import xlsxwriter  # noqa: F401
+except ImportError:
+    _XLSX_ENGINE, _XLSX_ENGINE_KWARGS = "openpyxl", {}
+else:
+    # constant_memory is left off: pandas writes cells column by column, which that mode drops
+    _XLSX_ENGINE = "xlsxwriter"
+    _XLSX_ENGINE_KWARGS = {"options": {"strings_to_formulas": False, "strings_to_urls": False, "in_memory": True}}
+
+# Fixed widget options shared by the add and edit forms
+_UNITS = ("EUR", "USD", "GBP", "CHF", "other")
+# the two household members allowed as payer/participants
+_PEOPLE = ("Alessio", "Morgan")
+_SPLIT_MODES = ("Equal split", "Custom shares")
+_NEW_CATEGORY_OPTION = "Add new category..."
+
+# st.fragment reruns only the decorated function; older releases had it as
+# experimental_fragment, and without either the whole page reruns as before
+_fragment = getattr(st, "fragment", getattr(st, "experimental_fragment", lambda func: func))
+
+_EXPENSE_COLUMN_CONFIG = {
+    "amount": st.column_config.NumberColumn(format="%.2f"),
+    "shares_json": st.column_config.TextColumn(width="medium"),
+}
 
 
 @dataclass
@@ -80,6 +92,12 @@ def _show_grand_total_chf(
             st.caption(f"Converted using {source}" + (" (stale cache)" if stale else ""))
 
 
+def _write_lines(lines: List[str]):
+    """Render several lines as one markdown element; trailing double spaces keep the line breaks."""
+    if lines:
+        st.markdown("  \n".join(lines))
+
+
 def _show_skipped_units(skipped_units: Optional[Dict[str, float]] = None):
     if not skipped_units:
         return
@@ -87,9 +105,100 @@ def _show_skipped_units(skipped_units: Optional[Dict[str, float]] = None):
     st.caption("Excluded from CHF conversion (missing rate): " + ", ".join(parts))
 
 
+def _show_messages(state_key: str):
+    """Render and clear the messages a widget callback left in session_state."""
+    for level, text in st.session_state.pop(state_key, ()):
+        getattr(st, level)(text)
+
+
+def _submit_expense_form(on_submit: Callable[[ExpenseInput], None],
+                         add_category_cb: Callable[[str], bool],
+                         batch: Callable[[], ContextManager]):
+    """
+    on_click of the 'Add Expense' button.
+
+    Runs before the script reruns, so the rerun that follows already shows the
+    new expense and category; messages are left for the form to render.
+    """
+    state = st.session_state
+    msgs = state["_expense_form_msgs"] = []
+
+    # Basic validation logic before constructing ExpenseInput
+    amount = state.get("add_amount")
+    payer = state.get("add_payer") or ""
+    participants_list = list(state.get("add_participants") or ())
+    if amount is None or amount <= 0:
+        msgs.append(("error", "Amount must be greater than 0."))
+        return
+    if not payer.strip():
+        msgs.append(("error", "Payer name is required."))
+        return
+    if not participants_list:
+        msgs.append(("error", "At least one participant is required."))
+        return
+
+    # Convert the date value to ISO string ("YYYY-MM-DD")
+    try:
+        date_iso = state.get("add_date").isoformat()
+    except Exception:
+        msgs.append(("error", "Invalid date."))
+        return
+
+    # the category and the expense are saved together
+    with batch():
+        # Determine final category: if the user chose "Add new category..." it
+        # is created (and persisted) now.
+        category_final = state.get("add_category")
+        if category_final == _NEW_CATEGORY_OPTION:
+            new_category_name = (state.get("add_new_category") or "").strip()
+            if not new_category_name:
+                msgs.append(("error", "Please either pick an existing category or type a new one and submit the form."))
+                return
+            if not add_category_cb(new_category_name):
+                msgs.append(("error", "Could not add category (it may already exist)."))
+                return
+            category_final = new_category_name
+            # select it in the dropdown on the next run
+            state["add_category"] = category_final
+            msgs.append(("success", f"Category '{category_final}' added and selected."))
+
+        # Validate custom shares when selected
+        shares: Dict[str, float] = {}
+        if state.get("add_split_mode") == "Custom shares":
+            # one pass: rounded shares, raw total and the non-positive check
+            total_shares = 0.0
+            all_positive = True
+            for p in participants_list:
+                v = state.get(f"share_{p}", 0.0)
+                shares[p] = round(v, 2)
+                total_shares += v
+                all_positive = all_positive and v > 0
+            if not all_positive:
+                msgs.append(("error", "All custom shares must be greater than 0."))
+                return
+            total_shares = round(total_shares, 2)
+            if abs(total_shares - round(amount, 2)) > 0.01:
+                msgs.append(("error", f"Custom shares sum to {total_shares:.2f} but amount is {amount:.2f}. Adjust shares."))
+                return
+
+        # Build ExpenseInput and hand back to caller
+        on_submit(ExpenseInput(
+            amount=round(amount, 2),
+            payer=payer,
+            participants=participants_list,
+            category=category_final,
+            description=(state.get("add_description") or "").strip(),
+            unit=state.get("add_unit"),
+            shares=shares,
+            date=date_iso,
+        ))
+    msgs.append(("success", "Expense added."))
+
+
 def display_expense_form(on_submit: Callable[[ExpenseInput], None],
                          categories: List[str],
-                         add_category_cb: Callable[[str], bool]):
+                         add_category_cb: Callable[[str], bool],
+                         batch: Callable[[], ContextManager] = contextlib.nullcontext):
     """
     Display the 'Add Expense' form.
 
@@ -97,118 +206,114 @@ def display_expense_form(on_submit: Callable[[ExpenseInput], None],
       - on_submit: callback invoked with ExpenseInput when the form validates
       - categories: list of categories to show in the dropdown
       - add_category_cb: function(name)->bool used to persist a new category
+      - batch: context manager factory wrapped around the category and expense
+        writes of one submit (e.g. tracker.batch)
     """
     st.header("Add Expense")
     # Use a Streamlit form so the whole payload is submitted at once
     with st.form(key="expense_form"):
         # Basic fields
-        amount = st.number_input(
+        st.number_input(
             "Amount",
             min_value=0.0,
             value=None,
             format="%.2f",
             placeholder="Enter amount",
+            key="add_amount",
         )
-        unit = st.selectbox("Unit / Currency", options=["EUR", "USD", "GBP", "CHF", "other"], index=3)
+        st.selectbox("Unit / Currency", options=_UNITS, index=3, key="add_unit")
         # Payer restricted to the two household members (UI enforces allowed values)
-        payer = st.selectbox("Payer Name", options=["Alessio", "Morgan"])
+        st.selectbox("Payer Name", options=_PEOPLE, key="add_payer")
         # Participants chosen from the same two names; default both selected
-        participants = st.multiselect("Participants", options=["Alessio", "Morgan"], default=["Alessio", "Morgan"])
+        participants = st.multiselect("Participants", options=_PEOPLE, default=_PEOPLE, key="add_participants")
 
         # Category selection with an "Add new category..." entry.
-        extra_opt = "Add new category..."
-        cat_options = list(categories) + [extra_opt]
-        selected_cat = st.selectbox("Category", options=cat_options)
-        new_category_name = ""
-        if selected_cat == extra_opt:
-            # When user wants to add a new category, provide a text input and Add button.
+        cat_options = (*categories, _NEW_CATEGORY_OPTION)
+        selected_cat = st.selectbox("Category", options=cat_options, key="add_category")
+        if selected_cat == _NEW_CATEGORY_OPTION:
             # When user wants to add a new category, provide a text input.
             # The new category will be created when the whole form is submitted.
-            new_category_name = st.text_input("New category name")
+            new_category_name = st.text_input("New category name", key="add_new_category")
             if not new_category_name:
                 st.info("Type a category name and submit the form to add it.")
 
         # Date input: required for filtering (stored as ISO string)
-        date_val = st.date_input("Date", value=datetime.date.today())
+        st.date_input("Date", value=datetime.date.today(), key="add_date")
         # Optional free-text note for informational context in the expense list.
-        description = st.text_input("Expense description (optional)")
+        st.text_input("Expense description (optional)", key="add_description")
 
         # Split mode: equal or custom shares
-        split_mode = st.radio("Split mode", options=["Equal split", "Custom shares"])
-        custom_shares: Dict[str, float] = {}
+        split_mode = st.radio("Split mode", options=_SPLIT_MODES, key="add_split_mode")
         if split_mode == "Custom shares":
             st.write("Enter custom share amounts (must sum to total amount):")
             # Show one input per selected participant
             for p in participants:
                 # use unique key so Streamlit can differentiate inputs
-                custom_shares[p] = st.number_input(f"Share for {p}", min_value=0.0, format="%.2f", key=f"share_{p}")
+                st.number_input(f"Share for {p}", min_value=0.0, format="%.2f", key=f"share_{p}")
 
-        submit_button = st.form_submit_button("Add Expense")
+        # validation and saving happen in the callback, before the rerun renders the page
+        st.form_submit_button(
+            "Add Expense",
+            on_click=_submit_expense_form,
+            args=(on_submit, add_category_cb, batch),
+        )
+        _show_messages("_expense_form_msgs")
 
-        if submit_button:
-            # Basic validation logic before constructing ExpenseInput
-            participants_list = [p for p in participants]
-            if amount is None or amount <= 0:
-                st.error("Amount must be greater than 0.")
-                return
-            if not payer.strip():
-                st.error("Payer name is required.")
-                return
-            if not participants_list:
-                st.error("At least one participant is required.")
-                return
 
-            # Convert the date value to ISO string ("YYYY-MM-DD")
-            try:
-                date_iso = date_val.isoformat()
-            except Exception:
-                st.error("Invalid date.")
-                return
+def _shares_json(items: tuple) -> str:
+    """Compact JSON object for a fingerprint's (person, share) pairs."""
+    if orjson is not None:
+        return orjson.dumps(dict(items)).decode("utf-8")
+    return json.dumps(dict(items), separators=(",", ":"), ensure_ascii=False)
+
+
+def _expense_fingerprint(expenses: List[Expense]) -> tuple:
+    """Hashable snapshot of every field shown in the expense table (the cache key below)."""
+    return tuple(
+        (e.id, e.date, e.category, e.amount, e.unit, e.payer, tuple(e.participants), e.description, tuple(e.shares.items()))
+        for e in expenses
+    )
 
-            # Determine final category: if the user chose "Add new category..." and
-            # didn't press Add, allow adding it now (and persist).
-            category_final = selected_cat
-            if selected_cat == extra_opt:
-                if new_category_name.strip():
-                    added = add_category_cb(new_category_name.strip())
-                    if added:
-                        category_final = new_category_name.strip()
-                        st.success(f"Category '{category_final}' added and selected.")
-                        # Rerun to show the newly added category in the selectbox
-                        _trigger_rerun()
-                    else:
-                        st.error("Could not add category (it may already exist).")
-                        return
-                else:
-                    st.error("Please either pick an existing category or type a new one and submit the form.")
-                    return
-
-            # Validate custom shares when selected
-            shares: Dict[str, float] = {}
-            if split_mode == "Custom shares":
-                total_shares = sum(custom_shares.get(p, 0.0) for p in participants_list)
-                total_shares = round(total_shares, 2)
-                if any(custom_shares.get(p, 0.0) <= 0 for p in participants_list):
-                    st.error("All custom shares must be greater than 0.")
-                    return
-                if abs(total_shares - round(amount, 2)) > 0.01:
-                    st.error(f"Custom shares sum to {total_shares:.2f} but amount is {amount:.2f}. Adjust shares.")
-                    return
-                shares = {p: round(custom_shares[p], 2) for p in participants_list}
-
-            # Build ExpenseInput and hand back to caller
-            expense = ExpenseInput(
-                amount=round(amount, 2),
-                payer=payer,
-                participants=participants_list,
-                category=category_final,
-                description=description.strip(),
-                unit=unit,
-                shares=shares,
-                date=date_iso,
-            )
-            on_submit(expense)
-            st.success("Expense added.")
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _build_expense_table(fingerprint: tuple):
+    """
+    Expense table and {unit: total} (sorted by unit) for a fingerprint.
+    Reruns with unchanged expenses skip building the frames.
+    """
+    df = pd.DataFrame.from_records(
+        list(fingerprint),
+        columns=["id", "date", "category", "amount", "unit", "payer", "participants", "description", "shares"],
+    )
+    df["id"] = df["id"].astype("int64")
+    df["amount"] = df["amount"].astype(float)
+    # participants stored as tuple -> join into string for display/export
+    df["participants"] = df["participants"].map(", ".join)
+    # keep shares as JSON string to preserve mapping
+    df["shares_json"] = df.pop("shares").map(_shares_json)
+    # few distinct values: dictionary-encoded in the Arrow table sent to the browser
+    df = df.astype({"category": "category", "unit": "category", "payer": "category"})
+    df = df.sort_values(by="id", ascending=False).reset_index(drop=True)
+    # a plain dict is enough for a handful of currencies; no groupby needed
+    totals: Dict[str, float] = defaultdict(float)
+    for _, _, _, amount, unit, *_ in fingerprint:
+        totals[unit] += float(amount)
+    return df, dict(sorted(totals.items()))
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _build_xlsx(fingerprint: tuple) -> bytes:
+    """XLSX export (expenses + totals sheets) for a fingerprint."""
+    df, totals = _build_expense_table(fingerprint)
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine=_XLSX_ENGINE, engine_kwargs=_XLSX_ENGINE_KWARGS) as writer:
+        df.to_excel(writer, index=False, sheet_name="expenses")
+        # write totals to a separate sheet
+        pd.DataFrame(list(totals.items()), columns=["unit", "amount"]).to_excel(
+            writer, index=False, sheet_name="totals_by_currency"
+        )
+    # context manager already saved into buffer
+    return buffer.getvalue()
 
 
 def display_expense_list(
@@ -233,53 +338,27 @@ def display_expense_list(
     _show_grand_total_chf(grand_total_chf, fx_snapshot=fx_snapshot)
     _show_skipped_units(skipped_units)
 
-    # Build DataFrame from expenses
-    rows = []
-    for e in expenses:
-        rows.append({
-            "id": int(getattr(e, "id", "")),
-            "date": getattr(e, "date", ""),
-            "category": getattr(e, "category", ""),
-            "amount": float(getattr(e, "amount", 0.0)),
-            "unit": getattr(e, "unit", "EUR"),
-            "payer": getattr(e, "payer", ""),
-
-            # participants stored as list -> join into string for display/export
-            "participants": ", ".join(getattr(e, "participants", []) or []),
-            "description": getattr(e, "description", ""),
-
-            # keep shares as JSON string to preserve mapping
-            "shares_json": json.dumps(getattr(e, "shares", {}) or {}),
-        })
-
-    df = pd.DataFrame(rows, columns=["id", "date", "category", "amount", "unit", "payer", "participants", "description", "shares_json"])
-    df = df.sort_values(by="id", ascending=False).reset_index(drop=True)
+    fingerprint = _expense_fingerprint(expenses)
+    df, totals = _build_expense_table(fingerprint)
 
     # Display as interactive table
-    st.dataframe(df.style.format({"amount": "{:.2f}"}), use_container_width=True)
+    # formatting is done client-side from column_config, so no Styler is built
+    st.dataframe(df, column_config=_EXPENSE_COLUMN_CONFIG, use_container_width=True)
 
     # Add a simple summary (totals per currency)
-    totals = df.groupby("unit")["amount"].sum().reset_index()
-    st.markdown("**Totals by currency**")
-    for _, r in totals.iterrows():
-        st.write(f"- {r['unit']}: {r['amount']:.2f}")
-
-    # Provide XLSX export
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="expenses")
-        # write totals to a separate sheet
-        totals.to_excel(writer, index=False, sheet_name="totals_by_currency")
-    # context manager already saved into buffer
-    buffer.seek(0)
-    bts = buffer.getvalue()
-
-    st.download_button(
-        label="Download as XLSX",
-        data=bts,
-        file_name="expenses.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    _write_lines(["**Totals by currency**", *(f"- {unit}: {amount:.2f}" for unit, amount in totals.items())])
+
+    # The workbook is only written once asked for; after that it follows the
+    # data for the rest of the session (cached per fingerprint).
+    if st.button("Prepare XLSX export"):
+        st.session_state["_xlsx_requested"] = True
+    if st.session_state.get("_xlsx_requested"):
+        st.download_button(
+            label="Download as XLSX",
+            data=_build_xlsx(fingerprint),
+            file_name="expenses.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
 
 
 def display_balances(
@@ -304,18 +383,116 @@ def display_balances(
             st.write("No balances for this year.")
             continue
 
+        lines = []
         for unit in sorted(unit_balances.keys()):
             balances = unit_balances[unit]
-            st.markdown(f"**{unit}**")
+            lines.append(f"**{unit}**")
             in_favor = sorted([(p, a) for p, a in balances.items() if a > 0], key=lambda x: x[1], reverse=True)
             if in_favor:
                 # Show only the top positive balance for each year/currency.
                 name, amount = in_favor[0]
-                st.write(f"{name}: +{amount:.2f} {unit}")
+                lines.append(f"{name}: +{amount:.2f} {unit}")
             else:
-                st.write("No positive balance.")
+                lines.append("No positive balance.")
+        _write_lines(lines)
         st.markdown("---")
 
+# Chart palette shared by all category views; cycled when there are more categories
+_PALETTE = (
+    "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
+    "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf",
+)
+
+
+@functools.lru_cache(maxsize=64)
+def _category_colors(categories: frozenset) -> tuple:
+    """
+    (ordered, colors) for a set of categories: DEFAULT_CATEGORIES first in their
+    own order, then the rest sorted, each paired with a palette color.
+    """
+    ordered = [c for c in DEFAULT_CATEGORIES if c in categories]
+    first = set(ordered)
+    ordered += sorted(c for c in categories if c not in first)
+    colors = tuple(_PALETTE[i % len(_PALETTE)] for i in range(len(ordered)))
+    return tuple(ordered), colors
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _monthly_bars_spec(records: tuple, ordered: tuple, colors: tuple, amount_title: str, tooltip_title: str) -> dict:
+    """Vega-Lite spec of stacked monthly bars from (month, category, amount) records."""
+    data = pd.DataFrame.from_records(list(records), columns=["month", "category", "amount"])
+    color_scale = alt.Scale(domain=list(ordered), range=list(colors))
+    chart = alt.Chart(data).mark_bar().encode(
+        x=alt.X("month:T", title="Month", axis=alt.Axis(format="%Y-%m", labelAngle=-45)),
+        y=alt.Y("amount:Q", title=amount_title),
+        color=alt.Color("category:N", scale=color_scale, sort=list(ordered), legend=alt.Legend(title="Category")),
+        tooltip=[
+            alt.Tooltip("month:T", title="Month", format="%Y-%m"),
+            alt.Tooltip("category:N", title="Category"),
+            alt.Tooltip("amount:Q", title=tooltip_title, format=".2f"),
+        ],
+    ).properties(width="container", height=600)
+    return chart.to_dict()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _pie_spec(records: tuple, ordered: tuple, colors: tuple, unit: str, sort_legend: bool) -> dict:
+    """Vega-Lite spec of a category share donut from (category, amount, percent) records."""
+    data = pd.DataFrame.from_records(list(records), columns=["category", "amount", "percent"])
+    color_scale = alt.Scale(domain=list(ordered), range=list(colors))
+    color_kwargs = {"sort": list(ordered)} if sort_legend else {}
+    pie = alt.Chart(data).mark_arc(innerRadius=50).encode(
+        theta=alt.Theta(field="amount", type="quantitative"),
+        color=alt.Color(
+            field="category",
+            type="nominal",
+            scale=color_scale,
+            legend=alt.Legend(title="Category"),
+            **color_kwargs,
+        ),
+        tooltip=[
+            alt.Tooltip("category:N", title="Category"),
+            alt.Tooltip("amount:Q", title=f"Amount ({unit})", format=".2f"),
+            alt.Tooltip("percent:Q", title="Share", format=".1f"),
+        ],
+    ).properties(title=f"Category share ({unit})")
+    return pie.to_dict()
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _monthly_totals(rows: tuple, rates: Optional[tuple]) -> pd.DataFrame:
+    """
+    Amount per (month, category) for (year, month, category, amount, unit) rows,
+    converted to CHF with the (unit, rate) pairs in rates; per (unit, month,
+    category) when rates is None. Undated rows and units without a rate are left out.
+    """
+    # Build DataFrame with a month-start datetime column from the year/month each
+    # Expense parsed from its date (0 when missing or invalid).
+    df = pd.DataFrame.from_records(list(rows), columns=["year", "month", "category", "amount", "unit"])
+    df["amount"] = df["amount"].astype(float)
+    df["unit"] = df["unit"].str.upper()
+    if rates is not None:
+        rate = df["unit"].map(dict(rates))
+        known = rate.notna()
+        df = df[known].assign(amount=df["amount"][known] * rate[known].astype(float), unit="CHF")
+    # drop rows without a valid date
+    df = df[df["year"] > 0].reset_index(drop=True)
+    df = df.assign(month=pd.to_datetime(df[["year", "month"]].assign(day=1)))
+
+    # Aggregate by month, category (and unit when not converted); categorical
+    # keys group on their integer codes, observed=True keeps only pairs with rows
+    group_cols = ["month", "category"] if rates is not None else ["unit", "month", "category"]
+    df = df.astype({col: "category" for col in group_cols if col != "month"})
+    return df.groupby(group_cols, observed=True)["amount"].sum().reset_index()
+
+
+def _monthly_frame(monthly: tuple) -> pd.DataFrame:
+    """_monthly_totals()-shaped frame from (YYYYMM keys, categories, amounts) arrays."""
+    month_keys, categories, amounts = monthly
+    months = pd.to_datetime(pd.DataFrame({"year": month_keys // 100, "month": month_keys % 100, "day": 1}))
+    return pd.DataFrame({"month": months, "category": categories, "amount": amounts})
+
+
 def display_expenses_over_time(
     expenses: List[Expense],
     chf_rates: Optional[Dict[str, float]] = None,
@@ -324,10 +501,14 @@ def display_expenses_over_time(
     fx_snapshot: Optional[Dict[str, Any]] = None,
     skipped_units: Optional[Dict[str, float]] = None,
     chart_title: str = "Expenses over time",
+    monthly: Optional[tuple] = None,
 ):
     """Show stacked monthly bars of expenses over time.
 
     When chf_rates is provided, amounts are converted and aggregated in CHF only.
+    monthly: optional CHF totals already aggregated by the tracker, as returned by
+    ExpenseTracker.monthly_totals_chf(); the chart is then drawn from those
+    instead of re-reading every expense.
     """
     st.header(chart_title)
     if not expenses:
@@ -337,72 +518,31 @@ def display_expenses_over_time(
     if total_for_period_chf is not None:
         st.markdown(f"**Total for Period: {total_for_period_chf:.2f} CHF**")
     _show_skipped_units(skipped_units)
-
-    # Build DataFrame with a month-start datetime column.
-    rows = []
-    for e in expenses:
-        try:
-            dt = pd.to_datetime(getattr(e, "date", ""), errors="coerce")
-        except Exception:
-            dt = pd.NaT
-        unit = str(getattr(e, "unit", "EUR") or "EUR").upper()
-        amount = float(getattr(e, "amount", 0.0))
-        if chf_rates is not None:
-            rate = chf_rates.get(unit)
-            if rate is None:
-                continue
-            amount = amount * float(rate)
-            unit = "CHF"
-
-        rows.append({
-            "date": dt,
-            "month": pd.Period(dt, freq="M").to_timestamp() if not pd.isna(dt) else pd.NaT,
-            "category": getattr(e, "category", ""),
-            "amount": amount,
-            "unit": unit,
-        })
-
-    df = pd.DataFrame(rows)
-    # drop rows without a valid date
-    df = df.dropna(subset=["month"]).reset_index(drop=True)
-    if df.empty:
-        st.info("No dated expenses to chart.")
+    # nothing converts to CHF (e.g. the FX snapshot has no rate for any unit
+    # used): skip building frames that would end up empty
+    if chf_rates is not None and {str(e.unit).upper() for e in expenses}.isdisjoint(chf_rates):
+        st.info("No expenses with a CHF rate to chart.")
         return
 
-    # Aggregate by month, category (and unit when not converted)
-    group_cols = ["month", "category"] if chf_rates is not None else ["unit", "month", "category"]
-    agg = df.groupby(group_cols)["amount"].sum().reset_index()
-
-    # Determine global category ordering (use DEFAULT_CATEGORIES first)
-    all_cats = sorted(agg["category"].unique())
-    ordered = [c for c in DEFAULT_CATEGORIES if c in all_cats]
-    ordered += [c for c in all_cats if c not in ordered]
-
-    # Palette consistent with category totals view
-    PALETTE = [
-        "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
-        "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"
-    ]
-    if len(PALETTE) < len(ordered):
-        times = (len(ordered) + len(PALETTE) - 1) // len(PALETTE)
-        colors = (PALETTE * times)[: len(ordered)]
+    if monthly is not None and chf_rates is not None:
+        agg = _monthly_frame(monthly)
     else:
-        colors = PALETTE[: len(ordered)]
+        # the converted monthly totals are cached per (rows, rates): switching views
+        # or month ranges back and forth reuses them
+        rows = tuple((e._year, e._month, e.category, e.amount, e.unit) for e in expenses)
+        rates = tuple(sorted(chf_rates.items())) if chf_rates is not None else None
+        agg = _monthly_totals(rows, rates)
+    if agg.empty:
+        st.info("No dated expenses to chart.")
+        return
 
-    color_scale = alt.Scale(domain=ordered, range=colors)
+    # Global category ordering and colors, consistent with the category totals view
+    ordered, colors = _category_colors(frozenset(agg["category"].unique()))
 
     if chf_rates is not None:
-        chart = alt.Chart(agg).mark_bar().encode(
-            x=alt.X("month:T", title="Month", axis=alt.Axis(format="%Y-%m", labelAngle=-45)),
-            y=alt.Y("amount:Q", title="Amount (CHF)"),
-            color=alt.Color("category:N", scale=color_scale, sort=ordered, legend=alt.Legend(title="Category")),
-            tooltip=[
-                alt.Tooltip("month:T", title="Month", format="%Y-%m"),
-                alt.Tooltip("category:N", title="Category"),
-                alt.Tooltip("amount:Q", title="Amount (CHF)", format=".2f"),
-            ],
-        ).properties(width="container", height=600)
-        st.altair_chart(chart, use_container_width=True)
+        records = tuple(agg[["month", "category", "amount"]].itertuples(index=False, name=None))
+        spec = _monthly_bars_spec(records, ordered, colors, "Amount (CHF)", "Amount (CHF)")
+        st.vega_lite_chart(spec, use_container_width=True)
         return
 
     # Render one chart per currency/unit when no CHF conversion is requested.
@@ -412,29 +552,19 @@ def display_expenses_over_time(
         if sub.empty:
             continue
         st.markdown(f"**{unit}**")
-        chart = alt.Chart(sub).mark_bar().encode(
-            x=alt.X("month:T", title="Month", axis=alt.Axis(format="%Y-%m", labelAngle=-45)),
-            y=alt.Y("amount:Q", title=f"Amount ({unit})"),
-            color=alt.Color("category:N", scale=color_scale, sort=ordered, legend=alt.Legend(title="Category")),
-            tooltip=[
-                alt.Tooltip("month:T", title="Month", format="%Y-%m"),
-                alt.Tooltip("category:N", title="Category"),
-                alt.Tooltip("amount:Q", title="Amount", format=".2f"),
-            ],
-        ).properties(width="container", height=600)
-        st.altair_chart(chart, use_container_width=True)
+        records = tuple(sub[["month", "category", "amount"]].itertuples(index=False, name=None))
+        spec = _monthly_bars_spec(records, ordered, colors, f"Amount ({unit})", "Amount")
+        st.vega_lite_chart(spec, use_container_width=True)
 
 def display_settle_suggestions(suggestions_by_unit: Dict[str, List[str]]):
     """Show settle-up suggestions per currency."""
     st.header("Settle Suggestions")
     if suggestions_by_unit:
+        lines = []
         for unit, suggestions in suggestions_by_unit.items():
-            st.markdown(f"**{unit}**")
-            if not suggestions:
-                st.write("  Nothing to settle.")
-                continue
-            for s in suggestions:
-                st.write(f"  {s}")
+            lines.append(f"**{unit}**")
+            lines.extend(suggestions or ["Nothing to settle."])
+        _write_lines(lines)
     else:
         st.write("No settle suggestions available.")
 
@@ -450,8 +580,7 @@ def display_settle_suggestions_chf(
     _show_grand_total_chf(grand_total_chf, fx_snapshot=fx_snapshot)
     _show_skipped_units(skipped_units)
     if suggestions:
-        for s in suggestions:
-            st.write(f"  {s}")
+        _write_lines(suggestions)
     else:
         st.write("Nothing to settle.")
 
@@ -470,39 +599,22 @@ def display_category_totals(totals_by_unit: Dict[str, Dict[str, float]]):
     all_cats = set()
     for unit_map in totals_by_unit.values():
         all_cats.update(unit_map.keys())
-    # Start with default categories first, then any other categories sorted
-    ordered = [c for c in DEFAULT_CATEGORIES if c in all_cats]
-    ordered += sorted([c for c in all_cats if c not in ordered])
-
-    # Define a palette and ensure it covers all categories (cycle if needed)
-    PALETTE = [
-        "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
-        "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"
-    ]
-    if len(PALETTE) < len(ordered):
-        # extend by repeating palette as needed
-        times = (len(ordered) + len(PALETTE) - 1) // len(PALETTE)
-        colors = (PALETTE * times)[: len(ordered)]
-    else:
-        colors = PALETTE[: len(ordered)]
-
-    # Color scale configuration for Altair
-    color_scale = alt.Scale(domain=ordered, range=colors)
+    ordered, colors = _category_colors(frozenset(all_cats))
 
     for unit, cat_map in totals_by_unit.items():
-        st.markdown(f"**{unit}**")
         if not cat_map:
-            st.write("  No expenses.")
+            _write_lines([f"**{unit}**", "No expenses."])
             continue
 
         # show textual totals and overall sum
         total_amount = sum(float(v) for v in cat_map.values())
-        st.write(f"Total: {total_amount:.2f} {unit}")
+        lines = [f"**{unit}**", f"Total: {total_amount:.2f} {unit}"]
         # show category totals with percentage share in text
         for cat, total in cat_map.items():
             amt_f = float(total)
             pct = (amt_f / total_amount * 100) if total_amount > 0 else 0.0
-            st.write(f"  {cat}: {amt_f:.2f} {unit} ({pct:.1f}%)")
+            lines.append(f"{cat}: {amt_f:.2f} {unit} ({pct:.1f}%)")
+        _write_lines(lines)
 
         # Build DataFrame for charting including percent and label fields
         rows = []
@@ -513,7 +625,6 @@ def display_category_totals(totals_by_unit: Dict[str, Dict[str, float]]):
                 "category": cat,
                 "amount": amt_f,
                 "percent": pct,
-                "percent_label": f"{pct:.1f}%"
             })
         df = pd.DataFrame(rows)
 
@@ -523,20 +634,11 @@ def display_category_totals(totals_by_unit: Dict[str, Dict[str, float]]):
             continue
 
         # Pie chart: arc with consistent color mapping and tooltip including share %
-        pie = alt.Chart(df).mark_arc(innerRadius=50).encode(
-            theta=alt.Theta(field="amount", type="quantitative"),
-            color=alt.Color(field="category", type="nominal", scale=color_scale, legend=alt.Legend(title="Category")),
-            tooltip=[
-                alt.Tooltip("category:N", title="Category"),
-                alt.Tooltip("amount:Q", title=f"Amount ({unit})", format=".2f"),
-                alt.Tooltip("percent:Q", title="Share", format=".1f")
-            ]
-        ).properties(
-            title=f"Category share ({unit})"
-        )
+        records = tuple(df[["category", "amount", "percent"]].itertuples(index=False, name=None))
+        spec = _pie_spec(records, ordered, colors, unit, False)
 
         # Render chart without in-chart text labels (percentages shown in the textual list above)
-        st.altair_chart(pie, use_container_width=True)
+        st.vega_lite_chart(spec, use_container_width=True)
 
 
 def display_category_totals_chf(
@@ -567,144 +669,153 @@ def display_category_totals_chf(
         return
 
     # Stable category ordering and color mapping.
-    all_cats = sorted(df["category"].unique())
-    ordered = [c for c in DEFAULT_CATEGORIES if c in all_cats]
-    ordered += [c for c in all_cats if c not in ordered]
-
-    PALETTE = [
-        "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
-        "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"
-    ]
-    if len(PALETTE) < len(ordered):
-        times = (len(ordered) + len(PALETTE) - 1) // len(PALETTE)
-        colors = (PALETTE * times)[: len(ordered)]
+    ordered, colors = _category_colors(frozenset(df["category"].unique()))
+    records = tuple(df[["category", "amount", "percent"]].itertuples(index=False, name=None))
+    spec = _pie_spec(records, ordered, colors, "CHF", True)
+    st.vega_lite_chart(spec, use_container_width=True)
+
+    # Show lines sorted by highest contribution first.
+    ranked = df.sort_values(by="percent", ascending=False)
+    _write_lines([
+        f"{cat}: {amount:.2f} CHF ({pct:.1f}%)"
+        for cat, amount, pct in ranked[["category", "amount", "percent"]].itertuples(index=False, name=None)
+    ])
+
+
+def _share_defaults(expense: Expense, amount: float, participants: List[str]) -> Dict[str, float]:
+    """Prefill for the edit form's share inputs: the stored share, else an equal split."""
+    equal = round(amount / max(1, len(participants)), 2)
+    return {p: float(expense.shares.get(p, equal)) for p in participants}
+
+
+def _save_expense_edit(tracker, expense: Expense):
+    """on_click of 'Save changes': validate the edit form's widgets and apply them."""
+    state = st.session_state
+    msgs = state["_manage_expense_msgs"] = []
+    prefix = f"edit_{expense.id}_"
+    amount = state.get(prefix + "amount", 0.0)
+    participants = list(state.get(prefix + "participants") or ())
+    # basic validation
+    if amount <= 0:
+        msgs.append(("error", "Amount must be > 0"))
+        return
+    if not participants:
+        msgs.append(("error", "At least one participant required"))
+        return
+    shares_final = {}
+    if state.get(prefix + "split_mode") == "Custom shares":
+        # inputs not rendered yet (split mode switched in this submit) keep their default
+        total_shares = 0.0
+        for p, default in _share_defaults(expense, amount, participants).items():
+            v = state.get(f"{prefix}share_{p}", default)
+            shares_final[p] = round(v, 2)
+            total_shares += v
+        total_shares = round(total_shares, 2)
+        if abs(total_shares - round(amount, 2)) > 0.01:
+            msgs.append(("error", f"Custom shares sum to {total_shares:.2f} but amount is {amount:.2f}"))
+            return
+    date_selected = state.get(prefix + "date")
+    updated = tracker.edit_expense(
+        expense_id=expense.id,
+        amount=round(amount, 2),
+        payer=state.get(prefix + "payer"),
+        participants=participants,
+        category=state.get(prefix + "category"),
+        description=state.get(prefix + "description", ""),
+        unit=state.get(prefix + "unit"),
+        shares=shares_final,
+        date=date_selected.isoformat() if hasattr(date_selected, "isoformat") else ""
+    )
+    if updated:
+        # keep the edited expense selected although its label changed
+        state["manage_expense_id"] = expense.id
+        msgs.append(("success", "Expense updated."))
     else:
-        colors = PALETTE[: len(ordered)]
-    color_scale = alt.Scale(domain=ordered, range=colors)
+        msgs.append(("error", "Failed to update expense."))
 
-    pie = alt.Chart(df).mark_arc(innerRadius=50).encode(
-        theta=alt.Theta(field="amount", type="quantitative"),
-        color=alt.Color(
-            field="category",
-            type="nominal",
-            scale=color_scale,
-            legend=alt.Legend(title="Category"),
-            sort=ordered,
-        ),
-        tooltip=[
-            alt.Tooltip("category:N", title="Category"),
-            alt.Tooltip("amount:Q", title="Amount (CHF)", format=".2f"),
-            alt.Tooltip("percent:Q", title="Share", format=".1f"),
-        ],
-    ).properties(title="Category share (CHF)")
-    st.altair_chart(pie, use_container_width=True)
 
-    # Show lines sorted by highest contribution first.
-    for _, row in df.sort_values(by="percent", ascending=False).iterrows():
-        st.write(f"  {row['category']}: {row['amount']:.2f} CHF ({row['percent']:.1f}%)")
+def _delete_expense(tracker, expense_id: int):
+    """on_click of 'Delete expense'; does nothing unless the confirm box is ticked."""
+    state = st.session_state
+    if not state.get("manage_delete_confirm"):
+        return
+    msgs = state["_manage_expense_msgs"] = []
+    try:
+        ok = tracker.delete_expense(expense_id)
+    except Exception as exc:
+        msgs.append(("error", f"Error deleting expense: {exc}"))
+        return
+    if ok:
+        # the confirmation must not carry over to the next selected expense
+        state["manage_delete_confirm"] = False
+        state.pop("manage_expense_id", None)
+        msgs.append(("success", "Expense deleted."))
+    else:
+        msgs.append(("error", "Failed to delete expense. Check the server logs for details."))
 
 
+@_fragment
 def display_manage_expenses(tracker):
     """
     UI to select, edit and delete an existing expense.
     Expects a tracker instance (src.tracker.ExpenseTracker) with
     methods: list_expenses(), edit_expense(id, **kwargs), delete_expense(id).
+
+    Runs as a fragment: picking another expense, ticking the delete box and the
+    save/delete callbacks rerun only this view, not the whole page.
     """
     st.header("Edit / Delete Expense")
+    # outcome of a save/delete callback from the previous interaction
+    _show_messages("_manage_expense_msgs")
     exs = tracker.list_expenses()
     if not exs:
         st.info("No expenses recorded.")
         return
 
-    # Build selection options: show id, category, amount and date
-    options = {f"#{e.id} {e.category} {e.amount:.2f} {getattr(e, 'date', '')}": e.id for e in exs}
-    sel_label = st.selectbox("Select expense", options=list(options.keys()))
-    expense_id = options[sel_label]
-    expense = next((e for e in exs if e.id == expense_id), None)
+    # Options are expense ids; the widget formats the label (id, category, amount, date)
+    by_id = {e.id: e for e in exs}
+    expense_id = st.selectbox(
+        "Select expense",
+        options=list(by_id),
+        format_func=lambda i: f"#{i} {by_id[i].category} {by_id[i].amount:.2f} {by_id[i].date}",
+        key="manage_expense_id",
+    )
+    expense = by_id.get(expense_id)
     if not expense:
         st.error("Selected expense not found.")
         return
 
-    # Prefill form with existing values
+    # Prefill form with existing values; the save callback reads them back by key
+    prefix = f"edit_{expense.id}_"
     with st.form(key=f"edit_expense_{expense.id}"):
-        amount = st.number_input("Amount", min_value=0.0, format="%.2f", value=float(expense.amount))
-        unit_options = ["EUR", "USD", "GBP", "CHF", "other"]
-        unit_idx = unit_options.index(getattr(expense, "unit", "EUR")) if getattr(expense, "unit", "EUR") in unit_options else 0
-        unit = st.selectbox("Unit / Currency", options=unit_options, index=unit_idx)
-        payer = st.selectbox("Payer Name", options=["Alessio", "Morgan"], index=0 if expense.payer == "Alessio" else 1)
-        participants = st.multiselect("Participants", options=["Alessio", "Morgan"], default=list(expense.participants))
+        amount = st.number_input("Amount", min_value=0.0, format="%.2f", value=float(expense.amount), key=prefix + "amount")
+        unit_idx = _UNITS.index(expense.unit) if expense.unit in _UNITS else 0
+        st.selectbox("Unit / Currency", options=_UNITS, index=unit_idx, key=prefix + "unit")
+        st.selectbox("Payer Name", options=_PEOPLE, index=0 if expense.payer == "Alessio" else 1, key=prefix + "payer")
+        participants = st.multiselect("Participants", options=_PEOPLE, default=list(expense.participants), key=prefix + "participants")
         categories = tracker.get_categories()
         cat_index = categories.index(expense.category) if expense.category in categories else 0
-        category = st.selectbox("Category", options=categories, index=cat_index)
-        description = st.text_input("Description", value=getattr(expense, "description", ""))
+        st.selectbox("Category", options=categories, index=cat_index, key=prefix + "category")
+        st.text_input("Description", value=getattr(expense, "description", ""), key=prefix + "description")
         try:
             date_prefill = datetime.date.fromisoformat(expense.date) if getattr(expense, "date", "") else datetime.date.today()
         except Exception:
             date_prefill = datetime.date.today()
-        date_selected = st.date_input("Date", value=date_prefill)
+        st.date_input("Date", value=date_prefill, key=prefix + "date")
 
         # Split mode / shares
-        split_mode = "Custom shares" if getattr(expense, "shares", {}) else "Equal split"
-        split_mode = st.radio("Split mode", options=["Equal split", "Custom shares"], index=0 if split_mode == "Equal split" else 1)
-        shares = {}
+        split_mode = "Custom shares" if expense.shares else "Equal split"
+        split_mode = st.radio("Split mode", options=_SPLIT_MODES, index=_SPLIT_MODES.index(split_mode), key=prefix + "split_mode")
         if split_mode == "Custom shares":
             st.write("Enter custom share amounts (must sum to total amount):")
-            for p in participants:
-                shares[p] = st.number_input(f"Share for {p}", min_value=0.0, format="%.2f",
-                                            value=float(expense.shares.get(p, round(amount / max(1, len(participants)), 2))))
+            for p, default in _share_defaults(expense, amount, participants).items():
+                st.number_input(f"Share for {p}", min_value=0.0, format="%.2f", value=default,
+                                key=f"{prefix}share_{p}")
 
-        save_btn = st.form_submit_button("Save changes")
-
-        if save_btn:
-            # basic validation
-            if amount <= 0:
-                st.error("Amount must be > 0")
-            elif not participants:
-                st.error("At least one participant required")
-            else:
-                shares_final = {}
-                if split_mode == "Custom shares":
-                    total_shares = round(sum(shares.values()), 2)
-                    if abs(total_shares - round(amount, 2)) > 0.01:
-                        st.error(f"Custom shares sum to {total_shares:.2f} but amount is {amount:.2f}")
-                        return
-                    shares_final = {p: round(shares[p], 2) for p in participants}
-                updated = tracker.edit_expense(
-                    expense_id=expense.id,
-                    amount=round(amount, 2),
-                    payer=payer,
-                    participants=participants,
-                    category=category,
-                    description=description,
-                    unit=unit,
-                    shares=shares_final,
-                    date=date_selected.isoformat() if hasattr(date_selected, "isoformat") else ""
-                )
-                if updated:
-                    st.success("Expense updated.")
-                    # refresh so selector and list reflect changes
-                    try:
-                        _trigger_rerun()
-                    except Exception:
-                        pass
-                else:
-                    st.error("Failed to update expense.")
+        st.form_submit_button("Save changes", on_click=_save_expense_edit, args=(tracker, expense))
 
     # Delete UI (separate to avoid accidental deletes)
     st.markdown("---")
     st.write("Delete this expense")
-    delete_confirm = st.checkbox("I confirm I want to delete this expense")
-    if st.button("Delete expense") and delete_confirm:
-        try:
-            ok = tracker.delete_expense(expense.id)
-        except Exception as exc:
-            st.error(f"Error deleting expense: {exc}")
-            ok = False
-        if ok:
-            st.success("Expense deleted.")
-            try:
-                _trigger_rerun()
-            except Exception:
-                pass
-        else:
-            st.error("Failed to delete expense. Check the server logs for details.")
+    st.checkbox("I confirm I want to delete this expense", key="manage_delete_confirm")
+    st.button("Delete expense", on_click=_delete_expense, args=(tracker, expense.id))
@@ -18,216 +18,176 @@ import datetime
 
 
 DEFAULT_TIMELINE_START = datetime.date(2025, 1, 1)
-
-
-def _month_start_from_expense(expense):
-    try:
-        d = datetime.date.fromisoformat(getattr(expense, "date", ""))
-    except Exception:
-        return None
-    return datetime.date(d.year, d.month, 1)
+# upper bound on the "Categories over time" dropdown; rarer categories are typed in
+MAX_CATEGORY_OPTIONS = 200
+OTHER_CATEGORY = "Other..."
 
 
 def _default_month_range(month_values):
-    present_month = datetime.date.today().replace(day=1)
+    present_month = _month_key(datetime.date.today())
     end_candidates = [m for m in month_values if m <= present_month]
     default_end = end_candidates[-1] if end_candidates else month_values[-1]
 
-    start_candidates = [m for m in month_values if DEFAULT_TIMELINE_START <= m <= default_end]
+    timeline_start = _month_key(DEFAULT_TIMELINE_START)
+    start_candidates = [m for m in month_values if timeline_start <= m <= default_end]
     default_start = start_candidates[0] if start_candidates else month_values[0]
     return default_start, default_end
 
 
 def _select_month_range(month_values, start_key: str, end_key: str):
-    month_labels = [m.strftime("%Y-%m") for m in month_values]
     default_start, default_end = _default_month_range(month_values)
-    start_label = st.selectbox(
-        "Start month",
-        options=month_labels,
-        index=month_values.index(default_start),
-        key=start_key,
-    )
-    end_label = st.selectbox(
-        "End month",
-        options=month_labels,
-        index=month_values.index(default_end),
-        key=end_key,
-    )
-    start_month = month_values[month_labels.index(start_label)]
-    end_month = month_values[month_labels.index(end_label)]
+    # one rerun per Apply instead of one per selectbox change
+    with st.form(key=f"{start_key}_form"):
+        start_month = st.selectbox(
+            "Start month",
+            options=month_values,
+            index=month_values.index(default_start),
+            format_func=_month_label,
+            key=start_key,
+        )
+        end_month = st.selectbox(
+            "End month",
+            options=month_values,
+            index=month_values.index(default_end),
+            format_func=_month_label,
+            key=end_key,
+        )
+        st.form_submit_button("Apply")
     if start_month > end_month:
         start_month, end_month = end_month, start_month
     return start_month, end_month
 
 
-def _filter_expenses_by_month_range(expenses, start_month: datetime.date, end_month: datetime.date):
-    filtered = []
-    for e in expenses:
-        month_start = _month_start_from_expense(e)
-        if month_start is None:
-            continue
-        if start_month <= month_start <= end_month:
-            filtered.append(e)
-    return filtered
+@st.cache_data(show_spinner=False, max_entries=64)
+def _month_values_for(_tracker, tracker_id: int, version: int, category=None):
+    years, months_map = _tracker.available_periods(category)
+    return [year * 100 + month for year in years for month in months_map[year]]
 
 
-def main():
+def _month_values(tracker, category=None):
+    # sorted YYYYMM keys of the months with expenses; labels are only built for
+    # display. Cached per tracker and data version: every write moves the key,
+    # so stale entries are never hit and no explicit clear is needed
+    return _month_values_for(tracker, id(tracker), tracker.data_version(), category)
+
+
+def _month_key(month: datetime.date) -> int:
+    # YYYYMM, the tracker's period key
+    return month.year * 100 + month.month
+
+
+def _month_label(key: int) -> str:
+    return f"{key // 100:04d}-{key % 100:02d}"
+
+
+def _month_range_totals(tracker, fx_rates, state_key: str, start_month, end_month, category=None):
     """
-    Streamlit page: sidebar menu controls which view is shown.
-    Actions:
-      - Add Expense: show form and persist via tracker.add_expense
-      - List Expenses: optional year/month filters
-      - Show Balances: per-year balances by currency, with CHF settle suggestions
-      - Category Totals: aggregate by selected month or year
-      - Clear All Expenses: reset data (with single-button confirmation)
+    (expenses, total_chf, skipped_units, monthly) for an inclusive range of YYYYMM
+    keys, optionally of one category; monthly is ExpenseTracker.monthly_totals_chf()
+    for the chart.
+    Kept in session_state under state_key and reused while the tracker, the range,
+    the data version and the rates stay the same.
     """
-    st.title("Expense Tracker Dashboard")
-    tracker = ExpenseTracker()
-    fx_snapshot = tracker.get_fx_snapshot()
-    fx_rates = fx_snapshot.get("rates", {"CHF": 1.0})
-    backend_name, backend_msg = tracker.storage_status()
-    if backend_name == "google_sheets":
-        st.sidebar.success(backend_msg)
-    else:
-        st.sidebar.warning(backend_msg)
-        st.sidebar.caption(
-            "For indefinite cloud persistence, set GOOGLE_SHEET_ID and "
-            "GOOGLE_SERVICE_ACCOUNT_JSON in Streamlit app Secrets."
+    key = (
+        # a rebuilt tracker (e.g. after a code reload) restarts its version count
+        id(tracker),
+        tracker.data_version(),
+        start_month,
+        end_month,
+        category,
+        tuple(sorted(fx_rates.items())),
+    )
+    cached = st.session_state.get(state_key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    positions = tracker.expense_positions(start_month, end_month, category=category)
+    exs = tracker.list_expenses()
+    total_chf, skipped_units = tracker.grand_total_chf_at(positions, rates=fx_rates)
+    monthly = tracker.monthly_totals_chf(positions, rates=fx_rates)
+    result = ([exs[i] for i in positions.tolist()], total_chf, skipped_units, monthly)
+    st.session_state[state_key] = (key, result)
+    return result
+
+
+@components._fragment
+def _expenses_over_time_view(tracker, fx_rates, fx_snapshot):
+    # a fragment: applying a new month range reruns only this view
+    # filtering and CHF totals run on the tracker's column arrays; only the
+    # rows in range are materialized as Expense objects for the chart
+    exs = tracker.list_expenses()
+    grand_total_chf, all_skipped_units = tracker.grand_total_chf_at(None, rates=fx_rates)
+    filtered_exs = exs
+    total_for_period_chf = None
+    skipped_units_for_view = all_skipped_units
+    monthly = None
+
+    month_values = _month_values(tracker)
+
+    if month_values:
+        start_month, end_month = _select_month_range(
+            month_values,
+            start_key="expenses_over_time_start_month",
+            end_key="expenses_over_time_end_month",
+        )
+        filtered_exs, total_for_period_chf, skipped_units_for_view, monthly = _month_range_totals(
+            tracker, fx_rates, "_expenses_over_time_range", start_month, end_month
         )
-    if fx_snapshot.get("error"):
-        st.sidebar.warning(fx_snapshot.get("error"))
-    else:
-        as_of = fx_snapshot.get("as_of", "")
-        source = fx_snapshot.get("source", "FX provider")
-        if as_of:
-            st.sidebar.caption(f"{source} rates as of {as_of}")
-        else:
-            st.sidebar.caption(f"{source} rates loaded")
-    if fx_snapshot.get("stale"):
-        st.sidebar.caption("FX rates may be stale.")
-
-    menu = [
-        "Add Expense",
-        "List Expenses",
-        "Show Balances",
-        "Category Totals",
-        "Expenses over time",
-        "Categories over time",
-        "Edit Expense",
-        "Clear All Expenses",
-    ]
-    choice = st.sidebar.selectbox("Select an option", menu)
-
-    if choice == "Add Expense":
-        # prepare a callback to receive the ExpenseInput produced by the form
-        def on_submit(exp_input: components.ExpenseInput):
-            tracker.add_expense(
-                amount=exp_input.amount,
-                payer=exp_input.payer,
-                participants=exp_input.participants,
-                category=exp_input.category,
-                description=getattr(exp_input, "description", ""),
-                unit=exp_input.unit,
-                shares=getattr(exp_input, "shares", {}) or {},
-                date=getattr(exp_input, "date", ""),
-            )
 
-        # pass categories and add_category function so the form can persist new categories
-        components.display_expense_form(on_submit, tracker.get_categories(), tracker.add_category)
+    components.display_expenses_over_time(
+        filtered_exs,
+        chf_rates=fx_rates,
+        grand_total_chf=grand_total_chf,
+        total_for_period_chf=total_for_period_chf,
+        fx_snapshot=fx_snapshot,
+        skipped_units=skipped_units_for_view,
+        monthly=monthly,
+    )
 
-    elif choice == "List Expenses":
-        # show year/month filters derived from available expense dates
-        years, months_map = tracker.available_periods()
-        col1, col2 = st.columns(2)
-        with col1:
-            # Provide None as first option (no filtering)
-            year_sel = st.selectbox("Filter year (optional)", options=[None] + years, index=0)
-        with col2:
-            month_options = months_map.get(year_sel, []) if year_sel else []
-            month_sel = st.selectbox("Filter month (optional)", options=[None] + month_options, index=0)
-        # retrieve filtered list and display
-        if year_sel is None:
-            expenses = tracker.list_expenses()
-        else:
-            expenses = tracker.list_expenses(year=year_sel, month=month_sel)
-        grand_total_chf, skipped_units = tracker.grand_total_chf(expenses=expenses, rates=fx_rates)
-        components.display_expense_list(
-            expenses,
-            grand_total_chf=grand_total_chf,
-            fx_snapshot=fx_snapshot,
-            skipped_units=skipped_units,
-        )
 
-    elif choice == "Show Balances":
-        years, _ = tracker.available_periods()
-        yearly_balances = {}
-        for year in years:
-            year_expenses = tracker.list_expenses(year=year)
-            yearly_balances[year] = tracker.balances_for_expenses(year_expenses)
-
-        overall_suggestions = tracker.settle_suggestions_chf(rates=fx_rates)
-        overall_settle_sentence_chf = overall_suggestions[0] if overall_suggestions else None
-        components.display_balances(
-            yearly_balances,
-            overall_settle_sentence_chf=overall_settle_sentence_chf,
+@components._fragment
+def _categories_over_time_view(tracker, fx_rates, fx_snapshot):
+    # a fragment: picking a category or a month range reruns only this view
+    exs = tracker.list_expenses()
+    category_counts = tracker.category_counts()
+    if not category_counts:
+        st.info("No expenses recorded yet.")
+    else:
+        # the dropdown only lists the most used categories; the rest are typed in
+        options = [name for name, _ in category_counts[:MAX_CATEGORY_OPTIONS]]
+        if len(category_counts) > MAX_CATEGORY_OPTIONS:
+            options.append(OTHER_CATEGORY)
+        selected_category = st.selectbox(
+            "Category",
+            options=options,
+            help=f"The {MAX_CATEGORY_OPTIONS} most used categories; pick '{OTHER_CATEGORY}' to type another.",
         )
-
-    elif choice == "Category Totals":
-        # allow the user to aggregate totals for a month or a whole year
-        mode = st.radio("Aggregate by", options=["Month", "Year"])
-        years, months_map = tracker.available_periods()
-        if not years:
-            st.info("No expenses recorded yet.")
-        else:
-            # default to the most recent year that exists in data
-            year_sel = st.selectbox("Year", options=years, index=len(years) - 1)
-            if mode == "Month":
-                month_options = months_map.get(year_sel, [])
-                if not month_options:
-                    st.info("No months for selected year.")
-                else:
-                    month_sel = st.selectbox("Month", options=month_options, index=0)
-                    totals_chf, skipped_units = tracker.totals_by_month_chf(year_sel, month_sel, rates=fx_rates)
-                    components.display_category_totals_chf(
-                        totals_chf,
-                        grand_total_chf=round(sum(totals_chf.values()), 2),
-                        fx_snapshot=fx_snapshot,
-                        skipped_units=skipped_units,
-                    )
-            else:
-                totals_chf, skipped_units = tracker.totals_by_year_chf(year_sel, rates=fx_rates)
-                components.display_category_totals_chf(
-                    totals_chf,
-                    grand_total_chf=round(sum(totals_chf.values()), 2),
-                    fx_snapshot=fx_snapshot,
-                    skipped_units=skipped_units,
-                )
-
-    elif choice == "Expenses over time":
-        exs = tracker.list_expenses()
-        grand_total_chf, all_skipped_units = tracker.grand_total_chf(expenses=exs, rates=fx_rates)
-        filtered_exs = exs
+        if selected_category == OTHER_CATEGORY:
+            selected_category = st.text_input("Category name").strip()
+            if selected_category not in dict(category_counts):
+                if selected_category:
+                    st.warning(f"No expenses in category '{selected_category}'.")
+                return
+        category_positions = tracker.expense_positions(category=selected_category)
+        grand_total_chf, all_skipped_units = tracker.grand_total_chf_at(category_positions, rates=fx_rates)
+        filtered_exs = [exs[i] for i in category_positions.tolist()]
         total_for_period_chf = None
         skipped_units_for_view = all_skipped_units
+        monthly = None
 
-        month_values = sorted(
-            {
-                month_start
-                for month_start in (_month_start_from_expense(e) for e in exs)
-                if month_start is not None
-            }
-        )
-
+        month_values = _month_values(tracker, selected_category)
         if month_values:
             start_month, end_month = _select_month_range(
                 month_values,
-                start_key="expenses_over_time_start_month",
-                end_key="expenses_over_time_end_month",
+                start_key="categories_over_time_start_month",
+                end_key="categories_over_time_end_month",
             )
-            filtered_exs = _filter_expenses_by_month_range(exs, start_month, end_month)
-            total_for_period_chf, skipped_units_for_view = tracker.grand_total_chf(
-                expenses=filtered_exs,
-                rates=fx_rates,
+            filtered_exs, total_for_period_chf, skipped_units_for_view, monthly = _month_range_totals(
+                tracker,
+                fx_rates,
+                "_categories_over_time_range",
+                start_month,
+                end_month,
+                category=selected_category,
             )
 
         components.display_expenses_over_time(
@@ -237,71 +197,185 @@ def main():
             total_for_period_chf=total_for_period_chf,
             fx_snapshot=fx_snapshot,
             skipped_units=skipped_units_for_view,
+            chart_title=f"Category over time: {selected_category}",
+            monthly=monthly,
+        )
+
+
+@st.cache_resource
+def _get_tracker():
+    # one tracker per process, shared by reruns and widget callbacks
+    return ExpenseTracker()
+
+
+def _add_expense_view(tracker, fx_rates, fx_snapshot):
+    # prepare a callback to receive the ExpenseInput produced by the form
+    def on_submit(exp_input: components.ExpenseInput):
+        tracker.add_expense(
+            amount=exp_input.amount,
+            payer=exp_input.payer,
+            participants=exp_input.participants,
+            category=exp_input.category,
+            description=getattr(exp_input, "description", ""),
+            unit=exp_input.unit,
+            shares=getattr(exp_input, "shares", {}) or {},
+            date=getattr(exp_input, "date", ""),
         )
 
-    elif choice == "Categories over time":
-        exs = tracker.list_expenses()
-        categories = sorted(
-            {
-                str(getattr(e, "category", "")).strip()
-                for e in exs
-                if str(getattr(e, "category", "")).strip()
-            }
+    # pass categories and add_category function so the form can persist new categories;
+    # a submit that adds both a category and an expense is saved once
+    components.display_expense_form(
+        on_submit, tracker.get_categories(), tracker.add_category, batch=tracker.batch
+    )
+
+
+def _list_expenses_view(tracker, fx_rates, fx_snapshot):
+    # show year filter derived from available expense dates
+    years, _ = tracker.available_periods()
+    # both filters apply together on submit. The month options can't follow a
+    # year picked in the same submit, so all 12 are offered (a month without
+    # expenses shows an empty list); the month only applies with a year
+    with st.form(key="list_filters"):
+        col1, col2 = st.columns(2)
+        with col1:
+            # Provide None as first option (no filtering)
+            year_sel = st.selectbox("Filter year (optional)", options=[None] + years, index=0)
+        with col2:
+            month_sel = st.selectbox("Filter month (optional)", options=[None] + list(range(1, 13)), index=0)
+        st.form_submit_button("Apply")
+    # retrieve filtered list and display; the CHF total is memoized on the
+    # same positions until the data changes
+    expenses = tracker.list_expenses()
+    if year_sel is None:
+        positions = None
+    else:
+        first, last = (month_sel, month_sel) if month_sel else (1, 12)
+        positions = tracker.expense_positions(year_sel * 100 + first, year_sel * 100 + last)
+        expenses = [expenses[i] for i in positions.tolist()]
+    grand_total_chf, skipped_units = tracker.grand_total_chf_at(positions, rates=fx_rates)
+    components.display_expense_list(
+        expenses,
+        grand_total_chf=grand_total_chf,
+        fx_snapshot=fx_snapshot,
+        skipped_units=skipped_units,
+    )
+
+
+def _balances_view(tracker, fx_rates, fx_snapshot):
+    # every year's balances come from one pass over the tracker's arrays
+    yearly_balances = tracker.balances_by_year()
+
+    overall_suggestions = tracker.settle_suggestions_chf(rates=fx_rates)
+    overall_settle_sentence_chf = overall_suggestions[0] if overall_suggestions else None
+    components.display_balances(
+        yearly_balances,
+        overall_settle_sentence_chf=overall_settle_sentence_chf,
+    )
+
+
+def _category_totals_view(tracker, fx_rates, fx_snapshot):
+    # allow the user to aggregate totals for a month or a whole year
+    mode = st.radio("Aggregate by", options=["Month", "Year"])
+    years, months_map = tracker.available_periods()
+    if not years:
+        st.info("No expenses recorded yet.")
+        return
+    # default to the most recent year that exists in data
+    year_sel = st.selectbox("Year", options=years, index=len(years) - 1)
+    if mode == "Month":
+        month_options = months_map.get(year_sel, [])
+        if not month_options:
+            st.info("No months for selected year.")
+            return
+        month_sel = st.selectbox("Month", options=month_options, index=0)
+        totals_chf, grand_total_chf, skipped_units = tracker.totals_by_month_chf(
+            year_sel, month_sel, rates=fx_rates
         )
-        if not categories:
-            st.info("No expenses recorded yet.")
+    else:
+        totals_chf, grand_total_chf, skipped_units = tracker.totals_by_year_chf(year_sel, rates=fx_rates)
+    components.display_category_totals_chf(
+        totals_chf,
+        grand_total_chf=grand_total_chf,
+        fx_snapshot=fx_snapshot,
+        skipped_units=skipped_units,
+    )
+
+
+def _manage_expenses_view(tracker, fx_rates, fx_snapshot):
+    # edit/delete UI
+    components.display_manage_expenses(tracker)
+
+
+def _clear_all_view(tracker, fx_rates, fx_snapshot):
+    # simple confirm button to avoid accidental data loss
+    if st.button("Confirm Clear"):
+        tracker.clear()
+        st.success("All expenses cleared.")
+
+
+def _show_sidebar_status(tracker, fx_snapshot):
+    backend_name, backend_msg = tracker.storage_status()
+    # the status notes are collected and sent as a single sidebar caption
+    sidebar_notes = []
+    if backend_name == "google_sheets":
+        st.sidebar.success(backend_msg)
+    else:
+        st.sidebar.warning(backend_msg)
+        sidebar_notes.append(
+            "For indefinite cloud persistence, set GOOGLE_SHEET_ID and "
+            "GOOGLE_SERVICE_ACCOUNT_JSON in Streamlit app Secrets."
+        )
+    if fx_snapshot.get("error"):
+        st.sidebar.warning(fx_snapshot.get("error"))
+    else:
+        as_of = fx_snapshot.get("as_of", "")
+        source = fx_snapshot.get("source", "FX provider")
+        if as_of:
+            sidebar_notes.append(f"{source} rates as of {as_of}")
         else:
-            selected_category = st.selectbox("Category", options=categories)
-            category_exs = [
-                e for e in exs if str(getattr(e, "category", "")).strip() == selected_category
-            ]
-            grand_total_chf, all_skipped_units = tracker.grand_total_chf(
-                expenses=category_exs,
-                rates=fx_rates,
-            )
-            filtered_exs = category_exs
-            total_for_period_chf = None
-            skipped_units_for_view = all_skipped_units
-
-            month_values = sorted(
-                {
-                    month_start
-                    for month_start in (_month_start_from_expense(e) for e in category_exs)
-                    if month_start is not None
-                }
-            )
-            if month_values:
-                start_month, end_month = _select_month_range(
-                    month_values,
-                    start_key="categories_over_time_start_month",
-                    end_key="categories_over_time_end_month",
-                )
-                filtered_exs = _filter_expenses_by_month_range(category_exs, start_month, end_month)
-                total_for_period_chf, skipped_units_for_view = tracker.grand_total_chf(
-                    expenses=filtered_exs,
-                    rates=fx_rates,
-                )
-
-            components.display_expenses_over_time(
-                filtered_exs,
-                chf_rates=fx_rates,
-                grand_total_chf=grand_total_chf,
-                total_for_period_chf=total_for_period_chf,
-                fx_snapshot=fx_snapshot,
-                skipped_units=skipped_units_for_view,
-                chart_title=f"Category over time: {selected_category}",
-            )
+            sidebar_notes.append(f"{source} rates loaded")
+    if fx_snapshot.get("stale"):
+        sidebar_notes.append("FX rates may be stale.")
+    if sidebar_notes:
+        st.sidebar.caption("  \n".join(sidebar_notes))
+    # rates are otherwise reused for FX_CACHE_TTL_SECONDS (FX_RETRY_SECONDS after a failure)
+    st.sidebar.button("Refresh FX rates", on_click=tracker.get_fx_snapshot, kwargs={"force_refresh": True})
+
+
+# label -> view jump table, every view called as view(tracker, fx_rates, fx_snapshot);
+# _MENU keeps the display order
+_VIEWS = {
+    "Add Expense": _add_expense_view,
+    "List Expenses": _list_expenses_view,
+    "Show Balances": _balances_view,
+    "Category Totals": _category_totals_view,
+    "Expenses over time": _expenses_over_time_view,
+    "Categories over time": _categories_over_time_view,
+    "Edit Expense": _manage_expenses_view,
+    "Clear All Expenses": _clear_all_view,
+}
+_MENU = tuple(_VIEWS)
 
-    elif choice == "Edit Expense":
-        # New: show edit/delete UI
-        components.display_manage_expenses(tracker)
 
-    elif choice == "Clear All Expenses":
-        # simple confirm button to avoid accidental data loss
-        if st.button("Confirm Clear"):
-            tracker.clear()
-            st.success("All expenses cleared.")
+def main():
+    """
+    Streamlit page: sidebar menu controls which view is shown.
+    Actions:
+      - Add Expense: show form and persist via tracker.add_expense
+      - List Expenses: optional year/month filters
+      - Show Balances: per-year balances by currency, with CHF settle suggestions
+      - Category Totals: aggregate by selected month or year
+      - Clear All Expenses: reset data (with single-button confirmation)
+    """
+    st.title("Expense Tracker Dashboard")
+    tracker = _get_tracker()
+    tracker.refresh()
+    fx_snapshot = tracker.get_fx_snapshot()
+    fx_rates = fx_snapshot.get("rates", {"CHF": 1.0})
+    _show_sidebar_status(tracker, fx_snapshot)
 
+    choice = st.sidebar.selectbox("Select an option", _MENU)
+    _VIEWS[choice](tracker, fx_rates, fx_snapshot)
 
 if __name__ == "__main__":
     main()
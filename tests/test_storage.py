@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+import src.storage as storage
+from src.models import Expense
+from src.storage import Storage
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    data_file = str(tmp_path / "expenses_data.json")
+    monkeypatch.setattr(storage, "DATA_FILE", data_file)
+    monkeypatch.setattr(storage, "COMPRESSED_FILE", data_file + ".zst")
+    monkeypatch.setattr(storage, "LOG_FILE", str(tmp_path / "expenses_data.jsonl"))
+    monkeypatch.setattr(storage, "NEXT_ID_FILE", str(tmp_path / "expenses_next_id.txt"))
+    storage._load_expenses_cached.cache_clear()
+    yield tmp_path
+    Storage._close_append_fh()
+    storage._load_expenses_cached.cache_clear()
+
+def _write_plain(amounts, mtime):
+    data = {"next_id": len(amounts) + 1, "expenses": [Expense(id=i + 1, amount=a).to_dict() for i, a in enumerate(amounts)]}
+    with open(storage.DATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.utime(storage.DATA_FILE, (mtime, mtime))
+
+def test_newer_plain_snapshot_is_migrated_again(data_dir):
+    if storage.zstd is None:
+        pytest.skip("zstandard not installed")
+    _write_plain([1.0], 1_000_000)
+    assert [e.amount for e in Storage.load_expenses()] == [1.0]
+    os.utime(storage.COMPRESSED_FILE, (1_000_100, 1_000_100))
+    # the tracker rewrote the plain file after the first migration
+    _write_plain([1.0, 2.0], 1_000_200)
+    assert [e.amount for e in Storage.load_expenses()] == [1.0, 2.0]
+
+def test_missing_zstandard(data_dir, monkeypatch):
+    _write_plain([1.0], 1_000_000)
+    with open(storage.COMPRESSED_FILE, "wb") as f:
+        f.write(b"")
+    os.utime(storage.COMPRESSED_FILE, (1_000_100, 1_000_100))
+    monkeypatch.setattr(storage, "zstd", None)
+    with pytest.raises(RuntimeError, match="zstandard"):
+        Storage.load_expenses()
+    # a plain file newer than the compressed one is current and readable without zstandard
+    _write_plain([3.0], 1_000_200)
+    assert [e.amount for e in Storage.load_expenses()] == [3.0]
+
+def test_loaded_expenses_do_not_alias_the_cache(data_dir, monkeypatch):
+    monkeypatch.setattr(storage, "zstd", None)
+    _write_plain([5.0], 1_000_000)
+    first = Storage.load_expenses()
+    first[0].amount = 99.0
+    first[0].shares["x"] = 1.0
+    again = Storage.load_expenses()
+    assert again[0].amount == 5.0 and again[0].shares == {}
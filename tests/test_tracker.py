@@ -1,5 +1,11 @@
+import json
+import os
+
+import numpy as np
+
 import pytest
-from src.tracker import ExpenseTracker
+import src.tracker as tracker_module
+from src.tracker import ExpenseTracker, DATA_FILE, JOURNAL_FILE
 from src.models import Expense
 
 def test_add_expense():
@@ -17,16 +23,15 @@ def test_balances():
     tracker.add_expense(100.0, "Alice", ["Alice", "Bob"], "Food", "Dinner")
     tracker.add_expense(50.0, "Bob", ["Alice", "Bob"], "Transport", "Taxi")
     balances = tracker.balances()
-    assert balances["Alice"] == 25.0
-    assert balances["Bob"] == -25.0
+    assert balances["EUR"]["Alice"] == 25.0
+    assert balances["EUR"]["Bob"] == -25.0
 
 def test_settle_suggestions():
     tracker = ExpenseTracker()
     tracker.add_expense(100.0, "Alice", ["Alice", "Bob"], "Food", "Dinner")
     tracker.add_expense(50.0, "Bob", ["Alice", "Bob"], "Transport", "Taxi")
     suggestions = tracker.settle_suggestions()
-    assert len(suggestions) == 1
-    assert "Alice pays Bob 25.00" in suggestions
+    assert suggestions == {"EUR": ["Bob pays Alice 25.00 EUR"]}
 
 def test_clear_expenses():
     tracker = ExpenseTracker()
@@ -36,10 +41,286 @@ def test_clear_expenses():
     assert tracker._next_id == 1
 
 def test_load_expenses():
+    # under pytest a new tracker wipes the data files, so create the reader first
+    new_tracker = ExpenseTracker()
     tracker = ExpenseTracker()
     tracker.add_expense(100.0, "Alice", ["Alice", "Bob"], "Food", "Dinner")
     tracker.save()
-    new_tracker = ExpenseTracker()
+    new_tracker.reload()
     assert len(new_tracker.expenses) == 1
     assert new_tracker.expenses[0].amount == 100.0
-    assert new_tracker.expenses[0].payer == "Alice"
\ No newline at end of file
+    assert new_tracker.expenses[0].payer == "Alice"
+
+def _journal_lines():
+    with open(JOURNAL_FILE, "rb") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def test_journal_append_and_replay():
+    reader = ExpenseTracker()
+    tracker = ExpenseTracker()
+    # the first save has no snapshot to append to, so it writes DATA_FILE
+    tracker.add_expense(10.0, "Alice", ["Alice", "Bob"], date="2025-01-05")
+    assert os.path.exists(DATA_FILE) and not os.path.exists(JOURNAL_FILE)
+    tracker.add_expense(20.0, "Bob", ["Alice", "Bob"], date="2025-01-06")
+    tracker.edit_expense(1, amount=12.0)
+    tracker.delete_expense(2)
+    assert [op["op"] for op in _journal_lines()] == ["add", "edit", "delete"]
+    reader.reload()
+    assert [(e.id, e.amount) for e in reader.expenses] == [(1, 12.0)]
+    assert reader._next_id == 3
+
+def test_journal_compaction(monkeypatch):
+    monkeypatch.setattr(tracker_module, "JOURNAL_COMPACT_OPS", 2)
+    tracker = ExpenseTracker()
+    for amount in (1.0, 2.0, 3.0):
+        tracker.add_expense(amount, "Alice", ["Alice"])
+    assert len(_journal_lines()) == 2
+    # the journal is full: the next save folds everything back into DATA_FILE
+    tracker.add_expense(4.0, "Alice", ["Alice"])
+    assert not os.path.exists(JOURNAL_FILE)
+    with open(DATA_FILE, "rb") as f:
+        assert [d["amount"] for d in json.load(f)["expenses"]] == [1.0, 2.0, 3.0, 4.0]
+
+def test_replay_skips_duplicate_add():
+    reader = ExpenseTracker()
+    tracker = ExpenseTracker()
+    tracker.add_expense(10.0, "Alice", ["Alice"])
+    tracker.add_expense(20.0, "Alice", ["Alice"])
+    # a second writer journaling the same id must not replace the first expense
+    duplicate = Expense(id=2, amount=99.0, payer="Bob", participants=("Bob",)).to_dict()
+    with open(JOURNAL_FILE, "ab") as f:
+        f.write(json.dumps({"op": "add", "expense": duplicate, "next_id": 3}).encode() + b"\n")
+    reader.reload()
+    assert [(e.id, e.amount) for e in reader.expenses] == [(1, 10.0), (2, 20.0)]
+
+def test_two_writers_keep_both_adds():
+    first = ExpenseTracker()
+    second = ExpenseTracker()
+    reader = ExpenseTracker()
+    first.add_expense(10.0, "Alice", ["Alice"])
+    second.reload()
+    first.add_expense(20.0, "Alice", ["Alice"])
+    # second still holds the view without expense 2 and would hand out id 2 again
+    added = second.add_expense(30.0, "Bob", ["Bob"])
+    assert added.id == 3
+    reader.reload()
+    assert [(e.id, e.amount) for e in reader.expenses] == [(1, 10.0), (2, 20.0), (3, 30.0)]
+
+def test_two_writers_rebase_batch():
+    first = ExpenseTracker()
+    second = ExpenseTracker()
+    reader = ExpenseTracker()
+    first.add_expense(10.0, "Alice", ["Alice"])
+    first.add_expense(20.0, "Alice", ["Alice"])
+    second.reload()
+    first.add_expense(30.0, "Alice", ["Alice"])
+    first.delete_expense(2)
+    # a batch skips the pre-write reload, so its ops are rebased at save time
+    with second.batch():
+        added = second.add_expense(40.0, "Bob", ["Bob"])
+        second.edit_expense(2, amount=25.0)
+        second.edit_expense(1, description="updated")
+    assert added.id == 4
+    reader.reload()
+    assert [(e.id, e.amount, e.description) for e in reader.expenses] == [
+        (1, 10.0, "updated"), (3, 30.0, ""), (4, 40.0, ""),
+    ]
+
+
+def test_settle_matches_largest_debts_first():
+    lines = ExpenseTracker._settle_lines({"A": 60.0, "B": -10.0, "C": -50.0, "D": 0.0}, "EUR")
+    assert lines == ["C pays A 50.00 EUR", "B pays A 10.00 EUR"]
+    lines = ExpenseTracker._settle_lines({"A": 30.0, "B": 10.0, "C": -40.0}, "CHF")
+    assert lines == ["C pays A 30.00 CHF", "C pays B 10.00 CHF"]
+
+def test_versioned_cache_copies_and_invalidates():
+    tracker = ExpenseTracker()
+    tracker.add_expense(10.0, "Alice", ["Alice", "Bob"])
+    first = tracker.settle_suggestions()
+    first["EUR"].append("tampered")
+    assert tracker.settle_suggestions() == {"EUR": ["Bob pays Alice 5.00 EUR"]}
+    tracker.add_expense(10.0, "Bob", ["Alice", "Bob"])
+    assert tracker.settle_suggestions() == {"EUR": []}
+
+def test_balances_per_unit_on_cents():
+    tracker = ExpenseTracker()
+    tracker.add_expense(30.0, "Alice", ["Alice", "Bob", "Carol"], date="2024-03-01")
+    tracker.add_expense(10.0, "Bob", ["Alice"], unit="CHF", date="2025-07-01")
+    tracker.add_expense(8.0, "Carol", ["Alice", "Bob"], shares={"Alice": 2.0, "Bob": 6.0}, date="2025-08-01")
+    tracker.add_expense(0.1, "Alice", ["Alice", "Bob", "Carol"], date="2025-08-02")
+    assert tracker.balances() == {
+        "EUR": {"Alice": 18.07, "Bob": -16.03, "Carol": -2.03},
+        "CHF": {"Alice": -10.0, "Bob": 10.0},
+    }
+
+def test_id_lookups_after_deletes():
+    tracker = ExpenseTracker()
+    for amount in (1.0, 2.0, 3.0, 4.0):
+        tracker.add_expense(amount, "Alice", ["Alice"])
+    assert tracker.delete_expense(2)
+    assert not tracker.delete_expense(2)
+    assert tracker.edit_expense(3, amount=30.0).amount == 30.0
+    assert tracker.edit_expense("4", description="by string id").id == 4
+    assert tracker.edit_expense(99, amount=1.0) is None
+    # ids are never reused after a delete
+    assert tracker.add_expense(5.0, "Alice", ["Alice"]).id == 5
+    assert [e.id for e in tracker.expenses] == [1, 3, 4, 5]
+
+def test_batch_saves_once_on_exit():
+    tracker = ExpenseTracker()
+    tracker.add_expense(1.0, "Alice", ["Alice"])
+    with tracker.batch():
+        tracker.add_category("Pets")
+        tracker.add_expense(2.0, "Alice", ["Alice"], category="Pets")
+        assert not os.path.exists(JOURNAL_FILE)
+    # add_category needs a full save, so the whole batch lands in DATA_FILE
+    with open(DATA_FILE, "rb") as f:
+        data = json.load(f)
+    assert "Pets" in data["categories"]
+    assert [d["amount"] for d in data["expenses"]] == [1.0, 2.0]
+    with tracker.batch():
+        tracker.add_expense(3.0, "Alice", ["Alice"])
+        tracker.add_expense(4.0, "Alice", ["Alice"])
+    assert [op["expense"]["amount"] for op in _journal_lines()] == [3.0, 4.0]
+
+def test_delete_finds_slot_with_unordered_ids():
+    tracker = ExpenseTracker()
+    # malformed data: ids out of list order, so the binary search misses
+    data = {"next_id": 10, "expenses": [Expense(id=i, amount=float(i)).to_dict() for i in (5, 2, 9, 7)]}
+    with open(DATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    tracker.reload()
+    assert tracker.delete_expense(9)
+    assert tracker.delete_expense(5)
+    assert [e.id for e in tracker.expenses] == [2, 7]
+    tracker.add_expense(10.0, "Alice", ["Alice"])
+    assert tracker.delete_expense(7)
+    assert [e.id for e in tracker.expenses] == [2, 10]
+
+def _period_tracker():
+    tracker = ExpenseTracker()
+    tracker.add_expense(10.0, "Alice", ["Alice"], category="Food", date="2025-01-10")
+    tracker.add_expense(20.0, "Alice", ["Alice"], category="Travel", unit="CHF", date="2025-02-10")
+    tracker.add_expense(30.0, "Alice", ["Alice"], category="Food", unit="GBP", date="2025-02-20")
+    tracker.add_expense(40.0, "Alice", ["Alice"], category="Food", date="2025-03-01")
+    tracker.add_expense(50.0, "Alice", ["Alice"], category="Food")
+    return tracker
+
+RATES = {"CHF": 1.0, "EUR": 0.5}
+
+def test_positions_by_month_range_and_chf_total():
+    tracker = _period_tracker()
+    assert tracker.expense_positions().tolist() == [0, 1, 2, 3, 4]
+    assert tracker.expense_positions(202502, 202503).tolist() == [1, 2, 3]
+    assert tracker.expense_positions(None, 202501).tolist() == [0]
+    positions = tracker.expense_positions(202502, 202503)
+    expected = tracker.grand_total_chf([tracker.expenses[i] for i in positions], rates=RATES)
+    assert tracker.grand_total_chf_at(positions, rates=RATES) == expected == (40.0, {"GBP": 30.0})
+    assert tracker.grand_total_chf_at(None, rates=RATES) == (70.0, {"GBP": 30.0})
+
+def test_balances_by_year():
+    tracker = ExpenseTracker()
+    tracker.add_expense(30.0, "Alice", ["Alice", "Bob", "Carol"], date="2024-03-01")
+    tracker.add_expense(10.0, "Bob", ["Alice"], unit="CHF", date="2025-07-01")
+    tracker.add_expense(8.0, "Carol", ["Alice", "Bob"], shares={"Alice": 2.0, "Bob": 6.0}, date="2025-08-01")
+    tracker.add_expense(5.0, "Carol", ["Alice"])
+    by_year = tracker.balances_by_year()
+    assert sorted(by_year) == [2024, 2025]
+    for year, balances in by_year.items():
+        assert balances == tracker.balances_for_expenses(tracker.list_expenses(year=year))
+
+def test_grand_total_memo_follows_version():
+    tracker = _period_tracker()
+    positions = tracker.expense_positions(202502, 202503)
+    total = tracker.grand_total_chf_at(positions, rates=RATES)
+    total[1]["GBP"] = 0.0
+    assert tracker.grand_total_chf_at(positions, rates=RATES) == (40.0, {"GBP": 30.0})
+    tracker.add_expense(2.0, "Alice", ["Alice"], unit="CHF", date="2025-03-02")
+    assert tracker.grand_total_chf_at(tracker.expense_positions(202502, 202503), rates=RATES) == (42.0, {"GBP": 30.0})
+    # one entry per filter selection, bounded within a version
+    for n in range(tracker_module.POSITIONS_MEMO_SIZE + 5):
+        tracker.grand_total_chf_at(np.zeros(n, dtype=np.int64), rates=RATES)
+    assert len(tracker._cache["_grand_total_chf_memo"]) == tracker_module.POSITIONS_MEMO_SIZE
+
+def test_positions_by_category():
+    tracker = _period_tracker()
+    assert tracker.expense_positions(category="Food").tolist() == [0, 2, 3, 4]
+    assert tracker.expense_positions(202502, None, category="Food").tolist() == [2, 3]
+    assert tracker.expense_positions(category="Pets").tolist() == []
+
+def test_monthly_totals_chf():
+    tracker = _period_tracker()
+    months, categories, sums = tracker.monthly_totals_chf(None, rates=RATES)
+    # undated expenses and units without a rate are left out
+    assert months.tolist() == [202501, 202502, 202503]
+    assert categories == ["Food", "Travel", "Food"]
+    assert np.allclose(sums, [5.0, 20.0, 20.0])
+    months, categories, sums = tracker.monthly_totals_chf(tracker.expense_positions(category="Food"), rates=RATES)
+    assert months.tolist() == [202501, 202503]
+
+def test_skipped_units_fold_by_label():
+    tracker = ExpenseTracker()
+    tracker.add_expense(10.0, "Alice", ["Alice"], unit="gbp")
+    tracker.add_expense(5.0, "Alice", ["Alice"], unit="GBP")
+    tracker.add_expense(4.0, "Alice", ["Alice"], unit="EUR")
+    tracker.add_expense(3.0, "Alice", ["Alice"], unit="JPY")
+    assert tracker.grand_total_chf_at(None, rates=RATES) == (2.0, {"GBP": 15.0, "JPY": 3.0})
+
+def test_single_unit_chf_total():
+    tracker = ExpenseTracker()
+    tracker.add_expense(10.0, "Alice", ["Alice"])
+    tracker.add_expense(5.5, "Alice", ["Alice"], unit="eur")
+    assert tracker.grand_total_chf_at(None, rates=RATES) == (7.75, {})
+    assert tracker.grand_total_chf_at(None, rates={"CHF": 1.0}) == (0.0, {"EUR": 15.5})
+    assert tracker.grand_total_chf_at(np.zeros(0, dtype=np.int64), rates={"CHF": 1.0}) == (0.0, {})
+
+def test_two_writers_rebase_follows_new_ids():
+    first = ExpenseTracker()
+    second = ExpenseTracker()
+    reader = ExpenseTracker()
+    first.add_expense(10.0, "Alice", ["Alice"])
+    second.reload()
+    first.add_expense(20.0, "Alice", ["Alice"])
+    # both of second's ops name stale id 2, which first now owns
+    with second.batch():
+        edited = second.add_expense(30.0, "Bob", ["Bob"])
+        second.edit_expense(2, amount=35.0)
+        second.add_expense(40.0, "Bob", ["Bob"])
+        second.delete_expense(3)
+    assert edited.id == 3 and edited.amount == 35.0
+    reader.reload()
+    assert [(e.id, e.amount) for e in reader.expenses] == [(1, 10.0), (2, 20.0), (3, 35.0)]
+    assert second.expenses[-1] is edited
+
+class FakeSheets:
+    """In-memory stand-in for GoogleSheetsBackend."""
+
+    available = True
+
+    def __init__(self):
+        self.rows = []
+
+    def load_state(self):
+        return {"next_id": len(self.rows) + 1, "expenses": list(self.rows), "categories": []}
+
+    def save_state(self, state):
+        self.rows = list(state["expenses"])
+        return True
+
+    def append_expenses(self, rows):
+        self.rows.extend(rows)
+        return True
+
+def test_sheets_add_during_pending_save_is_kept(monkeypatch):
+    monkeypatch.setattr(tracker_module, "SHEETS_SAVE_DELAY_SECONDS", 60)
+    tracker = ExpenseTracker()
+    sheets = FakeSheets()
+    tracker._gs_backend, tracker._gs_available = sheets, True
+    tracker.load()
+    tracker.add_expense(10.0, "Alice", ["Alice"])
+    assert [d["id"] for d in sheets.rows] == [1]
+    # the edit waits for the delayed full save; the add that follows must not be lost to it
+    tracker.edit_expense(1, amount=12.0)
+    tracker.add_expense(20.0, "Alice", ["Alice"])
+    tracker.flush()
+    assert [(d["id"], d["amount"]) for d in sheets.rows] == [(1, 12.0), (2, 20.0)]